@@ -5,9 +5,28 @@
 #define bitDelay 60
 #define byteDelay 240
 
+//bulk mode: host sends BULK_MARKER, a 2-byte little endian length, then the
+//whole frame; every byte is clocked out and the responses are sent back
+//in one write
+#define BULK_MARKER 0x42
+#define BULK_MAX 700
+#define BULK_TIMEOUT 1000
+
+//a byte-at-a-time frame the host gave up on halfway is dropped after this
+//many ms without a byte, the host sends its bytes ~1-2 ms apart
+#define FRAME_IDLE_TIMEOUT 50
+
 uint8_t cmd;
 uint8_t resp;
 
+//position within the current byte-at-a-time frame, so a BULK_MARKER is only
+//recognised between frames and never inside one
+uint16_t framePos = 0;
+uint16_t frameLen = 0;
+unsigned long lastByteTime = 0;
+
+uint8_t bulkBuf[BULK_MAX];
+
 uint8_t GBSerialIO(uint8_t cmd) {
   uint8_t resp=0;
   for (uint8_t c=0;  c<8;  c++) {
@@ -37,17 +56,63 @@ uint8_t GBSerialIO(uint8_t cmd) {
   return resp;
 }
 
+void handleBulk() {
+  uint8_t lenBytes[2];
+  if (Serial.readBytes(lenBytes, 2) != 2) {
+    return;
+  }
+  uint16_t len = lenBytes[0] | (lenBytes[1] << 8);
+  if (len > BULK_MAX) {
+    len = BULK_MAX;
+  }
+  uint16_t got = Serial.readBytes(bulkBuf, len);
+  for (uint16_t i=0; i<got; i++) {
+    bulkBuf[i] = GBSerialIO(bulkBuf[i]);
+  }
+  Serial.write(bulkBuf, got);
+}
+
+void trackFrame(uint8_t cmd) {
+  if (framePos == 0 && cmd != 0x88) {
+    return;
+  }
+  if (framePos == 1 && cmd != 0x33) {
+    framePos = 0;
+    return;
+  }
+  if (framePos == 4) {
+    frameLen = cmd;
+  }
+  if (framePos == 5) {
+    frameLen = 10 + (frameLen | (cmd << 8));
+  }
+  framePos++;
+  if (framePos >= 6 && framePos >= frameLen) {
+    framePos = 0;
+  }
+}
+
 void setup() {
   pinMode(GBIn, INPUT_PULLUP);
   pinMode(GBOut, OUTPUT);
   pinMode(GBClock, OUTPUT);
   digitalWrite(GBClock, 1);
   Serial.begin(115200);
+  Serial.setTimeout(BULK_TIMEOUT);
 }
 
 void loop() {
   if (Serial.available() > 0) {
     cmd = Serial.read();
+    if (framePos != 0 && millis() - lastByteTime > FRAME_IDLE_TIMEOUT) {
+      framePos = 0;
+    }
+    lastByteTime = millis();
+    if (framePos == 0 && cmd == BULK_MARKER) {
+      handleBulk();
+      return;
+    }
+    trackFrame(cmd);
     resp = GBSerialIO(cmd);
     Serial.write(resp);
   }
@@ -0,0 +1,45 @@
+"""
+Pixels per second of every dither_factory mode, on a whole synthetic image
+and band by band the way iter_gbtile_pages runs them. Also checks that the
+error diffusion modes give the same result both ways.
+
+Run from the repo root: python -m benchmarks.bench_dither
+"""
+import argparse
+import time
+import numpy as np
+from gbprinter import image as gbimage
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark dithering modes')
+    parser.add_argument('-t', '--height',
+                        dest="height",
+                        default=1600,
+                        type=int,
+                        help="Image height in pixels, 160 wide"
+                        )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    #smooth gradient plus noise, so error diffusion has something to do
+    gradient = np.linspace(0,255,args.height)[:,None] + rng.normal(0,20,(args.height,160))
+    gray = np.clip(gradient,0,255).astype(np.uint8)
+    pixels = gray.size
+
+    print('{:>16} {:>14} {:>14}'.format('mode','whole px/s','banded px/s'))
+    for mode in gbimage.dither_factory.modes:
+        start = time.perf_counter()
+        whole = gbimage.dither_twobit(gray,mode)
+        whole_t = time.perf_counter() - start
+
+        dither_band = gbimage.dither_factory.stream(mode)
+        start = time.perf_counter()
+        banded = np.vstack([dither_band(gray[top:top+16],row=top) for top in range(0,args.height,16)])
+        banded_t = time.perf_counter() - start
+
+        if not np.array_equal(whole,banded):
+            raise AssertionError('{} differs when dithered band by band'.format(mode))
+        print('{:>16} {:>14.0f} {:>14.0f}'.format(mode,pixels/whole_t,pixels/banded_t))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark for the tile encoder and decoder. Compares twobit_to_gbtile and
+gbtile_to_twobit against the old loop-based versions on random images from
+1 to 100 pages tall and checks that both produce the same output. The
+round trip checks are in tests/test_image.py.
+
+Run from the repo root: python -m benchmarks.bench_gbtile
+"""
+import argparse
+import time
+import numpy as np
+from gbprinter import image as gbimage
+
+def legacy_twobit_to_gbtile(arr):
+    gbtile = b''
+    rows = arr.shape[0]
+    for strip in np.vsplit(arr,rows//8):
+        for tile in np.hsplit(strip,20):
+            tile_hex = b''
+            for row in tile:
+                low = bytes([sum([(x%2)*(2**(7-i)) for i,x in enumerate(row)])])
+                high = bytes([sum([(x//2)*(2**(7-i)) for i,x in enumerate(row)])])
+                tile_hex = tile_hex + low + high
+            gbtile = gbtile + tile_hex
+    return gbtile
+
+def legacy_gbtile_to_twobit(gbtile_bytes):
+    num_pages = len(gbtile_bytes)//640
+    twobit = np.empty((16*num_pages,160))
+    for s in range(num_pages*2):
+        strip_bytes = gbtile_bytes[320*s:320*(s+1)]
+        for t in range(20):
+            tile_bytes = strip_bytes[16*t:16*(t+1)]
+            for r in range(8):
+                row_bytes = tile_bytes[2*r:2*(r+1)]
+                low, high = row_bytes
+                mat_row = [(low>>i & 1) + 2*(high>>i & 1) for i in reversed(range(8))]
+                twobit[s*8+r,t*8:(t+1)*8] = mat_row
+    return twobit.astype(np.uint8)
+
+def same_output(a,b):
+    if type(a) == bytes:
+        return a == b
+    return a.dtype == b.dtype and np.array_equal(a,b)
+
+def best_time(func,arg,repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(arg)
+        best = min(best,time.perf_counter() - start)
+    return best,result
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark twobit_to_gbtile')
+    parser.add_argument('-p', '--pages',
+                        dest="pages",
+                        default=[1,10,100],
+                        type=int,
+                        nargs='+',
+                        help="Image heights to test, in 640-byte pages"
+                        )
+    parser.add_argument('-n', '--repeat',
+                        dest="repeat",
+                        default=3,
+                        type=int,
+                        help="Best-of-N repeats per measurement"
+                        )
+    parser.add_argument('--skip-legacy',
+                        dest="skip_legacy",
+                        action='store_true',
+                        help="Only time the current implementations"
+                        )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print('{:>6} {:>6} {:>12} {:>12} {:>8}'.format('func','pages','legacy (s)','new (s)','speedup'))
+    for pages in args.pages:
+        arr = rng.integers(0,4,size=(16*pages,160),dtype=np.uint8)
+        gbtile = gbimage.twobit_to_gbtile(arr)
+        cases = [
+            ('encode',gbimage.twobit_to_gbtile,legacy_twobit_to_gbtile,arr),
+            ('decode',gbimage.gbtile_to_twobit,legacy_gbtile_to_twobit,gbtile),
+        ]
+        for name,new_func,old_func,arg in cases:
+            new_t,new_out = best_time(new_func,arg,args.repeat)
+            if args.skip_legacy:
+                print('{:>6} {:>6} {:>12} {:>12.6f} {:>8}'.format(name,pages,'-',new_t,'-'))
+                continue
+            old_t,old_out = best_time(old_func,arg,1)
+            if not same_output(old_out,new_out):
+                raise AssertionError('{} output mismatch at {} pages'.format(name,pages))
+            print('{:>6} {:>6} {:>12.6f} {:>12.6f} {:>7.0f}x'.format(name,pages,old_t,new_t,old_t/new_t))
+
+if __name__ == '__main__':
+    main()
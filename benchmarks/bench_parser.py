@@ -0,0 +1,67 @@
+"""
+Parses a multi-page print session (INIT, DATA pages, PRINT and STATUS polls,
+as the Game Boy would send them) with PacketParser, one byte at a time
+through add_byte and in one go through feed, and checks every packet's
+checksum.
+
+Run from the repo root: python -m benchmarks.bench_parser
+"""
+import argparse
+import time
+import numpy as np
+from gbprinter.controller import build_frame
+from gbprinter.emulator import PacketParser
+
+def frame(cmd,packet=None,compression=0):
+    return build_frame(cmd,compression,packet) + bytes(2)
+
+def session_bytes(pages,seed=0):
+    """
+    The byte stream of one print of the given number of pages, in batches
+    of 9 like print_example.py sends them
+    """
+    rng = np.random.default_rng(seed)
+    stream = bytearray()
+    for first in range(0,pages,9):
+        stream += frame(0x01) + frame(0x0F)
+        for _ in range(first,min(first+9,pages)):
+            stream += frame(0x04,rng.integers(0,256,640,dtype=np.uint8).tobytes())
+            stream += frame(0x0F)
+        stream += frame(0x04) + frame(0x0F)
+        stream += frame(0x02,bytes([1,0x03,0xE4,0x40]))
+        stream += frame(0x0F) * 10
+    return bytes(stream)
+
+def parse_bytewise(stream):
+    parser = PacketParser()
+    packets = []
+    for rx in stream:
+        packets += parser.add_byte(rx)
+    return packets
+
+def parse_bulk(stream):
+    return PacketParser().feed(stream)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the packet parser')
+    parser.add_argument('-p', '--pages',
+                        dest="pages",
+                        default=90,
+                        type=int,
+                        help="Pages in the session"
+                        )
+    args = parser.parse_args()
+
+    stream = session_bytes(args.pages)
+    print('{} byte session'.format(len(stream)))
+    print('{:>10} {:>8} {:>10} {:>10}'.format('mode','packets','time (s)','MB/s'))
+    for name,func in [('add_byte',parse_bytewise),('feed',parse_bulk)]:
+        start = time.perf_counter()
+        packets = func(stream)
+        elapsed = time.perf_counter() - start
+        if not all(p.verify_checksum() for p in packets):
+            raise AssertionError('checksum mismatch')
+        print('{:>10} {:>8} {:>10.4f} {:>10.2f}'.format(name,len(packets),elapsed,len(stream)/elapsed/1e6))
+
+if __name__ == '__main__':
+    main()
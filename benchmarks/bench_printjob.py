@@ -0,0 +1,47 @@
+"""
+Prints an image end to end through PrintJob and Controller on a
+SimulatedPrinter with realistic link and print head timings, for every
+transport mode. Times are the printer's modelled clock, so runs are quick
+and repeatable; host CPU time is reported next to them.
+
+Run from the repo root: python -m benchmarks.bench_printjob
+"""
+import argparse
+import time
+from gbprinter import image
+from gbprinter.controller import Controller
+from gbprinter.printjob import PrintJob
+from gbprinter.simulator import SimulatedPrinter
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark print jobs on a simulated printer')
+    parser.add_argument('-i', '--image',
+                        dest="image",
+                        default='images/jimp.png',
+                        help="Image to print"
+                        )
+    parser.add_argument('--page-time',
+                        dest="page_time",
+                        default=0.65,
+                        type=float,
+                        help="Modelled seconds to print one 16-row page"
+                        )
+    args = parser.parse_args()
+
+    expected = b''.join(image.iter_gbtile_pages(args.image))
+    print('{:>8} {:>6} {:>6} {:>12} {:>10} {:>10}'.format('mode','rle','pages','modelled (s)','pages/min','cpu (s)'))
+    for batched in [False,True]:
+        for compression in [False,True]:
+            sim = SimulatedPrinter(byte_time=0.0012,latency=0.001,page_time=args.page_time)
+            printer = Controller(sim,batched=batched,compression=compression)
+            start = time.process_time()
+            PrintJob.from_image(printer,args.image,poll_interval=0).run()
+            cpu = time.process_time() - start
+            if bytes(sim.printed) != expected:
+                raise AssertionError('printed pages differ from the image')
+            print('{:>8} {:>6} {:>6} {:>12.2f} {:>10.1f} {:>10.3f}'.format(
+                  'batched' if batched else 'per-byte','on' if compression else 'off',
+                  sim.pages_printed,sim.elapsed,60*sim.pages_printed/sim.elapsed,cpu))
+
+if __name__ == '__main__':
+    main()
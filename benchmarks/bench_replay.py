@@ -0,0 +1,81 @@
+"""
+End-to-end emulator throughput from a capture file: the recorded bytes go
+through get_gb_data, the packet parser, handle_packet and the image writer
+as fast as they will go, with no Game Boy or Arduino attached.
+
+Without --capture, a print session is recorded first by running a
+Controller against a SimulatedPrinter, so the benchmark is repeatable
+anywhere.
+
+Run from the repo root: python -m benchmarks.bench_replay
+"""
+import argparse
+import tempfile
+import os
+from gbprinter import capture, image
+from gbprinter.controller import Controller
+from gbprinter.emulator import Emulator
+from gbprinter.writer import ImageWriter
+from gbprinter.simulator import SimulatedPrinter
+
+def record_session(filename,pages,image_file,compression):
+    """
+    Prints image_file's pages over and over until there are enough, in
+    batches of 9 with the status polls the emulator needs to finish each
+    """
+    tiles = list(image.iter_gbtile_pages(image_file))
+    printer = Controller(SimulatedPrinter(),batched=True,compression=compression,capture=filename)
+    for first in range(0,pages,9):
+        printer.cmd_init()
+        for n in range(first,min(first+9,pages)):
+            printer.cmd_data(tiles[n % len(tiles)])
+        printer.cmd_data()
+        last = first + 9 >= pages
+        printer.cmd_print(bottom_margin=3 if last else 0)
+        for _ in range(11):
+            printer.cmd_status()
+    printer.capture.close()
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay a capture through the emulator')
+    parser.add_argument('-c', '--capture',
+                        dest="capture",
+                        default=None,
+                        help="Capture file to replay, records a session if not given"
+                        )
+    parser.add_argument('-p', '--pages',
+                        dest="pages",
+                        default=90,
+                        type=int,
+                        help="Pages in the recorded session"
+                        )
+    parser.add_argument('-i', '--image',
+                        dest="image",
+                        default='images/jimp.png',
+                        help="Image printed in the recorded session"
+                        )
+    parser.add_argument('-z', '--compression',
+                        dest="compression",
+                        action='store_true',
+                        help="Record with RLE compressed DATA packets"
+                        )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = args.capture
+        if filename == None:
+            filename = os.path.join(tmp,'session.gbcap')
+            record_session(filename,args.pages,args.image,args.compression)
+        packets = len(capture.packet_index(filename))
+
+        writer = ImageWriter(os.path.join(tmp,'out'))
+        emu,size,seconds = capture.replay(filename,lambda port: Emulator(port,writer=writer))
+        writer.flush()
+        writer.close()
+
+    print('{} packets, {} bytes from the Game Boy, {} images'.format(packets,size,writer.written))
+    print('{:.4f} s, {:.2f} MB/s, {:.0f} packets/s, writer {:.4f} s'.format(
+          seconds,size/seconds/1e6,packets/seconds,writer.write_seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Wall time and peak memory of gray_resize on large camera-sized JPEGs, next
+to the old path (full-resolution decode, rotate and LANCZOS in RGB, then
+grayscale). Most of the memory is PIL's rather than Python's, so every run
+happens in its own subprocess and the peak is that process's high-water
+RSS above what it used before the call.
+
+Run from the repo root: python -m benchmarks.bench_resize
+"""
+import argparse
+import resource
+import subprocess
+import tempfile
+import json
+import time
+import sys
+import os
+import numpy as np
+from PIL import Image
+from gbprinter import image as gbimage
+
+def legacy_gray_resize(in_image,rotate='auto',align='center'):
+    """
+    gray_resize as it was before the grayscale, draft and reduce changes
+    """
+    in_image = Image.open(in_image)
+    image = in_image
+    if gbimage.needs_rotation(image.size,rotate):
+        image = image.transpose(Image.ROTATE_270)
+    new_h,final_h,offset = gbimage.layout(image.size,align)
+    image = image.resize((160,new_h),resample=Image.LANCZOS)
+    image_new = Image.new('RGB',(160,final_h),(255,255,255))
+    if offset != None:
+        image_new.paste(image,(0,offset))
+    return image_new.convert('L')
+
+def make_photo(filename,size,seed=0):
+    """
+    Photo-like JPEG: smooth shading with some noise, built a strip at a
+    time so making it doesn't need much memory
+    """
+    w,h = size
+    rng = np.random.default_rng(seed)
+    photo = Image.new('RGB',size)
+    x = np.arange(w)
+    for top in range(0,h,512):
+        y = np.arange(top,min(top+512,h))[:,None]
+        base = 127 + 70*np.sin(x/(w/9)) * np.cos(y/(h/7))
+        strip = base[:,:,None] + [0,20,-20] + rng.normal(0,12,(len(y),w,3))
+        photo.paste(Image.fromarray(np.clip(strip,0,255).astype(np.uint8),'RGB'),(0,top))
+    photo.save(filename,quality=90)
+
+def peak_rss_kb():
+    #ru_maxrss survives fork and exec, so it would start at the parent's
+    #peak; VmHWM belongs to this process alone
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+def child(mode,filename):
+    func = legacy_gray_resize if mode == 'legacy' else gbimage.gray_resize
+    before = peak_rss_kb()
+    start = time.perf_counter()
+    func(filename)
+    elapsed = time.perf_counter() - start
+    after = peak_rss_kb()
+    print(json.dumps({'seconds':elapsed, 'peak_kb':after - before}))
+
+def run_child(mode,filename):
+    out = subprocess.run([sys.executable,'-m','benchmarks.bench_resize','--child',mode,filename],
+                         check=True,capture_output=True,text=True).stdout
+    return json.loads(out)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark gray_resize on large JPEGs')
+    parser.add_argument('-m', '--megapixels',
+                        dest="megapixels",
+                        default=[12,24,48],
+                        type=int,
+                        nargs='+',
+                        help="Photo sizes to test, 4:3"
+                        )
+    parser.add_argument('--child',
+                        dest="child",
+                        default=None,
+                        nargs=2,
+                        help=argparse.SUPPRESS
+                        )
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    print('{:>4} {:>12} {:>12} {:>12} {:>12} {:>10}'.format('MP','legacy (s)','legacy MB','new (s)','new MB','max diff'))
+    with tempfile.TemporaryDirectory() as tmp:
+        for mp in args.megapixels:
+            h = int((mp*1e6*3/4)**0.5)
+            w = h*4//3
+            filename = os.path.join(tmp,'{}mp.jpg'.format(mp))
+            make_photo(filename,(w,h))
+            legacy = run_child('legacy',filename)
+            new = run_child('new',filename)
+            diff = np.abs(np.array(legacy_gray_resize(filename),dtype=int) - np.array(gbimage.gray_resize(filename))).max()
+            print('{:>4} {:>12.3f} {:>12.1f} {:>12.3f} {:>12.1f} {:>10}'.format(
+                  mp,legacy['seconds'],legacy['peak_kb']/1024,new['seconds'],new['peak_kb']/1024,diff))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""
+Compression ratio and encode speed of rle_compress on the sample images,
+one 640-byte DATA packet at a time, plus a check that Emulator.decompress
+gets every packet back. Then times rle_decompress against the old
+list-based decompressor on all-literal and all-run packets.
+
+Run from the repo root: python -m benchmarks.bench_rle
+"""
+import argparse
+import glob
+import os
+import time
+from gbprinter import image as gbimage
+from gbprinter.emulator import Emulator
+
+def legacy_decompress(comp_data):
+    raw_data = [0]*640
+    comp_offset = 0
+    raw_offset = 0
+    while comp_offset < len(comp_data):
+        command_byte = comp_data[comp_offset]
+        comp_offset += 1
+        if command_byte & 0x80: #compressed run
+            length = command_byte - 0x80 + 2
+            duped_byte = comp_data[comp_offset]
+            comp_offset += 1
+            raw_data[raw_offset:raw_offset+length] = [duped_byte]*length
+            raw_offset += length
+        else: #uncompressed run
+            length = command_byte + 1
+            unduped_data = comp_data[comp_offset:comp_offset+length]
+            comp_offset += length
+            raw_data[raw_offset:raw_offset+length] = unduped_data
+            raw_offset += length
+    return raw_data
+
+def per_call(func,arg,number=20000):
+    start = time.perf_counter()
+    for _ in range(number):
+        func(arg)
+    return (time.perf_counter() - start) / number
+
+def bench_decompress():
+    literal = bytes(range(256)) * 2 + bytes(range(128))
+    cases = [
+        ('all-literal',gbimage.rle_compress(literal),literal),
+        ('all-run',gbimage.rle_compress(bytes(640)),bytes(640)),
+    ]
+    print('{:>16} {:>8} {:>12} {:>12} {:>8}'.format('packet','packed','legacy (us)','new (us)','speedup'))
+    for name,comp,raw in cases:
+        if gbimage.rle_decompress(comp) != raw or bytes(legacy_decompress(comp)) != raw:
+            raise AssertionError('{} packet did not decompress correctly'.format(name))
+        old_t = per_call(legacy_decompress,comp)
+        new_t = per_call(gbimage.rle_decompress,comp)
+        print('{:>16} {:>8} {:>12.2f} {:>12.2f} {:>7.1f}x'.format(name,len(comp),old_t*1e6,new_t*1e6,old_t/new_t))
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark RLE compression')
+    parser.add_argument('files',
+                        nargs='*',
+                        default=sorted(glob.glob('images/*')),
+                        help="Images to convert and compress"
+                        )
+    parser.add_argument('-d', '--dithering',
+                        dest="dither",
+                        default='bayer',
+                        choices=gbimage.dither_factory.modes,
+                        help="Dithering algorithm to use"
+                        )
+    args = parser.parse_args()
+
+    print('{:>16} {:>6} {:>8} {:>8} {:>7} {:>10}'.format('image','pages','raw','packed','ratio','MB/s'))
+    total_raw = total_packed = 0
+    for filename in args.files:
+        payload = gbimage.image_to_gbtile(filename,args.dither)
+        pages = [payload[i:i+640] for i in range(0,len(payload),640)]
+
+        start = time.perf_counter()
+        packed = [gbimage.rle_compress(page) for page in pages]
+        elapsed = time.perf_counter() - start
+
+        for page,comp in zip(pages,packed):
+            if Emulator.decompress(None,comp) != page:
+                raise AssertionError('round trip failed for {}'.format(filename))
+
+        #the controller only sends the compressed form when it's smaller
+        sent = sum(min(len(c),len(p)) for c,p in zip(packed,pages))
+        total_raw += len(payload)
+        total_packed += sent
+        print('{:>16} {:>6} {:>8} {:>8} {:>7.3f} {:>10.2f}'.format(
+            os.path.basename(filename),len(pages),len(payload),sent,
+            sent/len(payload),len(payload)/elapsed/1e6))
+    print('{:>16} {:>6} {:>8} {:>8} {:>7.3f}'.format('total','',total_raw,total_packed,total_packed/total_raw))
+    print()
+    bench_decompress()
+
+if __name__ == '__main__':
+    main()
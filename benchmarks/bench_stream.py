@@ -0,0 +1,54 @@
+"""
+Peak memory and time of image_to_gbtile against the streaming
+iter_gbtile_pages on synthetic images of growing height. The source image
+itself is held by PIL outside of tracemalloc, so the peaks are the numpy
+and bytes copies made along the way.
+
+Run from the repo root: python -m benchmarks.bench_stream
+"""
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from PIL import Image
+from gbprinter import image as gbimage
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed,peak
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark streaming conversion')
+    parser.add_argument('-t', '--heights',
+                        dest="heights",
+                        default=[1000,10000,50000],
+                        type=int,
+                        nargs='+',
+                        help="Source heights in pixels, at 320 px wide"
+                        )
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print('{:>8} {:>10} {:>12} {:>10} {:>12}'.format('height','full (s)','full peak','stream (s)','stream peak'))
+    for height in args.heights:
+        source = Image.fromarray(rng.integers(0,256,size=(height,320,3),dtype=np.uint8),'RGB')
+
+        def full():
+            gbimage.image_to_gbtile(source,rotate='none')
+
+        def stream():
+            for page in gbimage.iter_gbtile_pages(source,rotate='none'):
+                pass
+
+        full_t,full_peak = measure(full)
+        stream_t,stream_peak = measure(stream)
+        print('{:>8} {:>10.3f} {:>11.0f}K {:>10.3f} {:>11.0f}K'.format(
+            height,full_t,full_peak/1024,stream_t,stream_peak/1024))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Loopback benchmark for Controller transport modes. Sends DATA packets through
+a fake serial port that behaves like controller_arduino (byte-at-a-time echo
+plus the bulk mode) and reports packets per second for the old per-byte
+round trips and the batched mode.
+
+Time spent on the fake link is modelled rather than slept: every read() that
+waits on the board costs one USB round trip and every byte clocked to the
+printer costs the sketch's bit/byte delays. Pass --port to run against real
+hardware instead.
+
+Run from the repo root: python -m benchmarks.bench_transport
+"""
+import argparse
+import time
+from gbprinter.controller import Controller
+
+class LoopbackSerial:
+    """
+    Stand-in for the arduino bridge. The printer side answers 0x81 0x00 to
+    the two response bytes of each frame and 0x00 to everything else.
+    """
+
+    def __init__(self,latency=0.001,byte_time=0.0012):
+        self.latency = latency
+        self.byte_time = byte_time
+        self.elapsed = 0.0
+        self._out = bytearray()
+        self._pos = 0
+        self._len = 0
+
+    def _clock(self,byte):
+        self.elapsed += self.byte_time
+        pos = self._pos
+        if pos == 0 and byte != 0x88:
+            return 0
+        if pos == 4:
+            self._len = byte
+        elif pos == 5:
+            self._len = 10 + (self._len | byte << 8)
+        self._pos += 1
+        if pos >= 6 and self._pos >= self._len:
+            self._pos = 0
+            return 0x00
+        if pos >= 6 and self._pos == self._len - 1:
+            return 0x81
+        return 0
+
+    def write(self,data):
+        if data[0] == Controller.bulk_marker and self._pos == 0:
+            size = data[1] | data[2] << 8
+            self._out += bytes(self._clock(b) for b in data[3:3+size])
+        else:
+            self._out += bytes(self._clock(b) for b in data)
+        return len(data)
+
+    def read(self,size=1):
+        self.elapsed += self.latency
+        data = bytes(self._out[:size])
+        del self._out[:size]
+        return data
+
+def run(printer,packets,payload):
+    start = time.perf_counter()
+    for _ in range(packets):
+        response = printer.cmd_data(payload)
+    return time.perf_counter() - start,response
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark Controller transport modes')
+    parser.add_argument('-n', '--packets',
+                        dest="packets",
+                        default=20,
+                        type=int,
+                        help="DATA packets to send per mode"
+                        )
+    parser.add_argument('-l', '--latency',
+                        dest="latency",
+                        default=0.001,
+                        type=float,
+                        help="Modelled USB round trip per read, in seconds"
+                        )
+    parser.add_argument('--port',
+                        dest="port",
+                        default=None,
+                        help="Use a real controller_arduino on this port"
+                        )
+    args = parser.parse_args()
+
+    payload = bytes(i%256 for i in range(640))
+    print('{:>8} {:>10} {:>10}'.format('mode','pkt/s','response'))
+    for batched in [False,True]:
+        if args.port:
+            printer = Controller(args.port,batched=batched)
+            wall,response = run(printer,args.packets,payload)
+            total = wall
+        else:
+            link = LoopbackSerial(latency=args.latency)
+            printer = Controller(link,batched=batched)
+            wall,response = run(printer,args.packets,payload)
+            total = wall + link.elapsed
+        print('{:>8} {:>10.2f} {:>10}'.format('batched' if batched else 'per-byte',
+                                              args.packets/total,
+                                              ' '.join(hex(r) for r in response)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Benchmark suite for the hot paths: resizing, every dither mode, tile
+encoding and decoding, RLE decompression in the emulator, packet parsing
+and whole Controller sends against a SimulatedPrinter. Runs on the images/
+samples plus a synthetic tall image, writes the timings as JSON, and
+compares them with a saved baseline.
+
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --baseline baseline.json
+
+Exits with status 1 if anything got slower than the baseline by more than
+--tolerance.
+"""
+import argparse
+import platform
+import timeit
+import json
+import glob
+import sys
+import os
+import numpy as np
+import PIL
+from PIL import Image
+from gbprinter import image
+from gbprinter.capture import ReplaySerial
+from gbprinter.controller import Controller
+from gbprinter.emulator import Emulator, PacketParser
+from gbprinter.printjob import send_batch
+from gbprinter.simulator import SimulatedPrinter
+from gbprinter.writer import ImageWriter
+from benchmarks.bench_parser import session_bytes
+
+FORMAT_VERSION = 1
+
+def tall_image(height=8000,seed=0):
+    """
+    Photo-like stand-in for a long print: smooth gradients plus noise,
+    480 px wide so it gets scaled down
+    """
+    rng = np.random.default_rng(seed)
+    y,x = np.mgrid[0:height,0:480]
+    base = 127 + 60*np.sin(x/37) + 60*np.cos(y/53)
+    rgb = np.clip(base[:,:,None] + rng.normal(0,20,(height,480,3)),0,255).astype(np.uint8)
+    return Image.fromarray(rgb,'RGB')
+
+def sources():
+    """
+    (name, loaded image) for each sample, loaded up front so file decoding
+    isn't part of the timings
+    """
+    images = []
+    for path in sorted(glob.glob('images/*')):
+        im = Image.open(path)
+        im.load()
+        images.append((os.path.basename(path),im))
+    images.append(('tall',tall_image()))
+    return images
+
+def cases():
+    """
+    (name, zero-argument callable) for everything timed
+    """
+    images = sources()
+    tall = dict(images)['tall']
+    gray = {'jimp.png':np.array(image.gray_resize(dict(images)['jimp.png'])),
+            'tall':np.array(image.gray_resize(tall))}
+    twobit = {name:image.dither_twobit(g,'bayer') for name,g in gray.items()}
+    tiles = {name:image.twobit_to_gbtile(t) for name,t in twobit.items()}
+    pages = [tiles['jimp.png'][i:i+640] for i in range(0,len(tiles['jimp.png']),640)]
+    compressed = [image.rle_compress(page) for page in pages]
+    session = session_bytes(9)
+
+    found = []
+    for name,im in images:
+        found.append(('gray_resize[{}]'.format(name),lambda im=im: image.gray_resize(im)))
+    for mode in image.dither_factory.modes:
+        for name,g in gray.items():
+            found.append(('dither[{},{}]'.format(mode,name),lambda g=g,mode=mode: image.dither_twobit(g,mode)))
+    for name in gray:
+        found.append(('twobit_to_gbtile[{}]'.format(name),lambda t=twobit[name]: image.twobit_to_gbtile(t)))
+        found.append(('gbtile_to_twobit[{}]'.format(name),lambda t=tiles[name]: image.gbtile_to_twobit(t)))
+    found.append(('image_to_gbtile[tall]',lambda: image.image_to_gbtile(tall)))
+
+    emu = Emulator(ReplaySerial([]),writer=ImageWriter(os.devnull))
+    found.append(('emulator_decompress[jimp.png]',lambda: [emu.decompress(c) for c in compressed]))
+
+    def parse_bytewise():
+        parser = PacketParser()
+        for rx in session:
+            parser.add_byte(rx)
+    found.append(('parser_add_byte[9 pages]',parse_bytewise))
+    found.append(('parser_feed[9 pages]',lambda: PacketParser().feed(session)))
+
+    for label,batched,compression in [('per-byte',False,False),('batched',True,False),('batched+rle',True,True)]:
+        printer = Controller(SimulatedPrinter(),batched=batched,compression=compression)
+        found.append(('controller_send[{}]'.format(label),
+                      lambda printer=printer: send_batch(printer,pages[:9])))
+    return found
+
+def measure(func,repeats=5):
+    """
+    Best seconds per call out of repeats runs, each long enough (~0.2 s) to
+    time reliably
+    """
+    timer = timeit.Timer(func)
+    number,_ = timer.autorange()
+    return min(timer.repeat(repeats,number)) / number
+
+def environment():
+    return {'python':platform.python_version(), 'numpy':np.__version__,
+            'pillow':PIL.__version__, 'machine':platform.machine(),
+            'processor':platform.processor()}
+
+def compare(results,baseline,tolerance):
+    """
+    Prints each case next to its baseline and returns the names of those
+    that got slower by more than tolerance (0.2 is 20%)
+    """
+    regressions = []
+    print('{:<40} {:>12} {:>12} {:>8}'.format('case','baseline ms','current ms','change'))
+    for name,result in results.items():
+        old = baseline.get(name)
+        if old == None:
+            print('{:<40} {:>12} {:>12.3f} {:>8}'.format(name,'-',1000*result['seconds'],'new'))
+            continue
+        change = result['seconds']/old['seconds'] - 1
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = ' SLOWER'
+        print('{:<40} {:>12.3f} {:>12.3f} {:>+7.1f}%{}'.format(
+              name,1000*old['seconds'],1000*result['seconds'],100*change,flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the benchmark suite')
+    parser.add_argument('-k', '--filter',
+                        dest="filter",
+                        default=None,
+                        help="Only run cases whose name contains this"
+                        )
+    parser.add_argument('-r', '--repeats',
+                        dest="repeats",
+                        default=5,
+                        type=int,
+                        help="Timing runs per case, the best one counts"
+                        )
+    parser.add_argument('-o', '--output',
+                        dest="output",
+                        default=None,
+                        help="Write results to this JSON file"
+                        )
+    parser.add_argument('-s', '--save',
+                        dest="save",
+                        default=None,
+                        help="Write results to this JSON file as the new baseline"
+                        )
+    parser.add_argument('-b', '--baseline',
+                        dest="baseline",
+                        default=None,
+                        help="Compare against this baseline JSON file"
+                        )
+    parser.add_argument('-t', '--tolerance',
+                        dest="tolerance",
+                        default=0.2,
+                        type=float,
+                        help="Slowdown allowed before a case counts as a regression"
+                        )
+    args = parser.parse_args()
+
+    results = {}
+    for name,func in cases():
+        if args.filter and args.filter not in name:
+            continue
+        seconds = measure(func,args.repeats)
+        results[name] = {'seconds':seconds}
+        if args.baseline == None:
+            print('{:<40} {:>10.3f} ms'.format(name,1000*seconds))
+
+    report = {'version':FORMAT_VERSION, 'environment':environment(), 'results':results}
+    for filename in [args.output,args.save]:
+        if filename != None:
+            with open(filename,'w') as f:
+                json.dump(report,f,indent=1)
+
+    if args.baseline != None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('environment') != report['environment']:
+            print('warning: baseline was recorded on {}'.format(baseline.get('environment')))
+        regressions = compare(results,baseline['results'],args.tolerance)
+        if regressions:
+            print('{} regressions: {}'.format(len(regressions),', '.join(regressions)))
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -1,2 +1,2 @@
-__all__ = ['controller','image']
-
+__all__ = ['controller','image','printjob','aio','ports','pool','batch','cache',
+           'writer','capture','simulator','metrics','cli']
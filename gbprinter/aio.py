@@ -0,0 +1,236 @@
+"""
+asyncio versions of Controller and Emulator. Both talk to a byte stream,
+anything with these methods:
+
+    write(data)        queue bytes to send, doesn't block
+    await drain()      wait until queued bytes are sent
+    await read(n)      up to n bytes, or b'' if nothing came before the
+                       stream's timeout
+    close()
+
+SerialStream wraps a pyserial port, memory_pipe() gives two connected
+in-memory streams for running controllers and emulators without hardware.
+"""
+from . import image
+from .controller import Controller, build_frame
+from .emulator import Emulator
+import serial
+import asyncio
+import logging
+
+class SerialStream:
+    """
+    Byte stream over a blocking pyserial port, reads run in the default
+    executor so they don't hold up the event loop
+    """
+
+    def __init__(self,port,baudrate=115200,timeout=.2):
+        if isinstance(port,str):
+            port = serial.Serial(port,baudrate=baudrate,timeout=timeout)
+        self.serial = port
+
+    def write(self,data):
+        self.serial.write(data)
+
+    async def drain(self):
+        pass
+
+    def _read(self,size):
+        waiting = self.serial.in_waiting
+        return self.serial.read(min(max(waiting,1),size))
+
+    async def read(self,size=1):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None,self._read,size)
+
+    def close(self):
+        self.serial.close()
+
+class MemoryStream:
+    """
+    One end of an in-memory pipe, see memory_pipe
+    """
+
+    def __init__(self,timeout=.2):
+        self.timeout = timeout
+        self.peer = None
+        self._buffer = bytearray()
+        self._event = asyncio.Event()
+        self.closed = False
+
+    def write(self,data):
+        if self.closed:
+            raise IOError('Stream is closed')
+        self.peer._buffer += data
+        self.peer._event.set()
+
+    async def drain(self):
+        pass
+
+    async def read(self,size=1):
+        if not self._buffer:
+            self._event.clear()
+            try:
+                await asyncio.wait_for(self._event.wait(),self.timeout)
+            except asyncio.TimeoutError:
+                return b''
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    def close(self):
+        self.closed = True
+
+def memory_pipe(timeout=.2):
+    """
+    Two connected streams: bytes written to one are read from the other
+    """
+    a = MemoryStream(timeout)
+    b = MemoryStream(timeout)
+    a.peer,b.peer = b,a
+    return a,b
+
+async def read_exactly(stream,size,timeout):
+    """
+    Keep reading until size bytes arrive or timeout seconds pass, returns
+    whatever came
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    data = b''
+    while len(data) < size and loop.time() < deadline:
+        data += await stream.read(size - len(data))
+    return data
+
+class AsyncController:
+    """
+    Same commands as Controller, but every one is a coroutine, so one event
+    loop can drive several printers at once
+    """
+
+    commands = Controller.commands
+    statuses = Controller.statuses
+    bulk_marker = Controller.bulk_marker
+    translate_status = Controller.translate_status
+
+    def __init__(self,stream,batched=False,compression=False):
+        self.logger = logging.getLogger(__name__)
+        self.stream = stream
+        self.batched = batched
+        self.compression = compression
+
+    @classmethod
+    async def open(cls,port,ready_timeout=5,**kwargs):
+        """
+        Opens a serial port and waits until the printer answers, instead of
+        sleeping for a fixed time while the Arduino boots
+        """
+        printer = cls(SerialStream(port),**kwargs)
+        await printer.wait_ready(ready_timeout)
+        return printer
+
+    async def wait_ready(self,timeout=5):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while loop.time() < deadline:
+            try:
+                response = await self.cmd_status()
+            except IOError:
+                #a closed stream fails before awaiting anything, so yield
+                #to the other printers on this loop before retrying
+                await asyncio.sleep(.05)
+                continue
+            if response[0] in [0x80,0x81]:
+                return response
+        raise IOError("Can't find printer!")
+
+    async def send_command(self,cmd,compression=0,packet=None):
+
+        if cmd not in self.commands:
+            raise ValueError('Invalid command type: {}'.format(cmd))
+
+        self.logger.debug('Sending %s command',self.commands[cmd])
+
+        frame = build_frame(cmd,compression,packet) + bytes(2)
+        if self.batched:
+            self.stream.write(bytes([self.bulk_marker]) + len(frame).to_bytes(2,byteorder='little') + frame)
+            await self.stream.drain()
+            #the arduino clocks each byte out at ~1.2 ms, so allow for that
+            echo = await read_exactly(self.stream,len(frame),1 + len(frame)*0.002)
+        else:
+            echo = b''
+            for byte in frame:
+                self.stream.write(bytes([byte]))
+                await self.stream.drain()
+                echo += await read_exactly(self.stream,1,.2)
+
+        if len(echo) != len(frame):
+            raise IOError('Expected {} bytes from printer, got {}'.format(len(frame),len(echo)))
+        response = [echo[-2],echo[-1]]
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Received 0x%02x 0x%02x',response[0],response[1])
+            self.logger.debug('%s',self.translate_status(response))
+
+        return response
+
+    async def cmd_init(self):
+        return await self.send_command(0x01)
+
+    async def cmd_print(self,top_margin=0,bottom_margin=0,palette=0xE4,exposure=0x40,pages=1):
+        margin = ( (top_margin % 16) << 4 )| (bottom_margin % 16)
+        packet = bytes([pages,margin,palette,exposure])
+        return await self.send_command(0x02,packet=packet)
+
+    async def cmd_data(self,packet=None,compression=None):
+        if compression == None:
+            compression = self.compression
+        if compression and packet:
+            compressed = image.rle_compress(packet)
+            if len(compressed) < len(packet):
+                return await self.send_command(0x04,compression=1,packet=compressed)
+        return await self.send_command(0x04,packet=packet)
+
+    async def cmd_break(self):
+        return await self.send_command(0x08)
+
+    async def cmd_status(self):
+        return await self.send_command(0x0F)
+
+    def close(self):
+        self.stream.close()
+
+class AsyncEmulator(Emulator):
+    """
+    Emulator reading from a byte stream inside an event loop. Packet
+    handling is the same as Emulator's, only the reads are awaited.
+    """
+
+    def __init__(self,stream,palette=image.PALETTES['gray'],writer=None):
+        Emulator.__init__(self,stream,palette,writer)
+
+    @classmethod
+    async def open(cls,port,ready_timeout=5,**kwargs):
+        """
+        Opens a serial port and waits for the Arduino's 'nice' handshake
+        """
+        stream = SerialStream(port)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + ready_timeout
+        while loop.time() < deadline:
+            stream.write(bytes([105]))
+            await stream.drain()
+            if await read_exactly(stream,4,.2) == b'nice':
+                return cls(stream,**kwargs)
+        stream.close()
+        raise IOError("Can't find Arduino!")
+
+    async def get_gb_data(self):
+        from_gb = await self.gbp_serial.read(4096)
+        if from_gb:
+            self.handle_records(from_gb)
+            await self.gbp_serial.drain()
+
+    async def run(self):
+        while True:
+            await self.get_gb_data()
@@ -0,0 +1,185 @@
+"""
+Converts whole folders of images to printer-ready gbtile data, one process
+per core. Each image becomes a .gbtile file (or an entry in a single zip
+archive), and a manifest of source sizes, modification times and options
+lets later runs skip images that haven't changed.
+
+    python -m gbprinter.batch artwork/ -o tiles/
+"""
+from . import image
+from concurrent.futures import ProcessPoolExecutor
+from time import monotonic
+import argparse
+import logging
+import zipfile
+import json
+import sys
+import os
+
+MANIFEST = 'manifest.json'
+EXTENSIONS = ['.png','.jpg','.jpeg','.gif','.bmp','.tif','.tiff','.webp']
+
+def find_images(folder):
+    paths = []
+    for root,dirs,files in os.walk(folder):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in EXTENSIONS:
+                paths.append(os.path.join(root,name))
+    return sorted(paths)
+
+def output_name(folder,path):
+    return os.path.splitext(os.path.relpath(path,folder))[0] + '.gbtile'
+
+def source_key(path,options):
+    stat = os.stat(path)
+    return [stat.st_size,stat.st_mtime_ns,options]
+
+def convert_one(path,dither_mode,rotate,align):
+    return image.image_to_gbtile(path,dither_mode,rotate,align)
+
+class FolderOutput:
+    """
+    Writes .gbtile files next to each other under a folder, keeping the
+    manifest in the same folder
+    """
+
+    def __init__(self,folder):
+        self.folder = folder
+        try:
+            with open(os.path.join(folder,MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except (OSError,ValueError):
+            self.manifest = {}
+
+    def has(self,name,key):
+        return self.manifest.get(name) == key and os.path.exists(os.path.join(self.folder,name))
+
+    def write(self,name,key,data):
+        path = os.path.join(self.folder,name)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        with open(path,'wb') as f:
+            f.write(data)
+        self.manifest[name] = key
+
+    def close(self):
+        os.makedirs(self.folder,exist_ok=True)
+        with open(os.path.join(self.folder,MANIFEST),'w') as f:
+            json.dump(self.manifest,f,indent=1)
+
+class ArchiveOutput:
+    """
+    Writes every .gbtile into one zip file, carrying unchanged entries over
+    from the previous archive
+    """
+
+    def __init__(self,filename):
+        self.filename = filename
+        self.manifest = {}
+        self.old = {}
+        if os.path.exists(filename):
+            with zipfile.ZipFile(filename) as old:
+                self.manifest = json.loads(old.read(MANIFEST))
+                self.old = {name:old.read(name) for name in old.namelist() if name != MANIFEST}
+        self.new = {}
+
+    def has(self,name,key):
+        return self.manifest.get(name) == key and name in self.old
+
+    def write(self,name,key,data):
+        self.new[name] = data
+        self.manifest[name] = key
+
+    def close(self):
+        tmp = self.filename + '.tmp'
+        with zipfile.ZipFile(tmp,'w',zipfile.ZIP_DEFLATED) as z:
+            for name in sorted(self.manifest):
+                data = self.new.get(name,self.old.get(name))
+                if data != None:
+                    z.writestr(name,data)
+            z.writestr(MANIFEST,json.dumps(self.manifest,indent=1))
+        os.replace(tmp,self.filename)
+
+def convert_folder(folder,output,dither_mode='bayer',rotate='auto',align='center',workers=None,force=False):
+    """
+    Converts every image under folder that changed since the last run.
+    output is a folder, or a filename ending in .zip for a single archive.
+    Returns (converted, skipped, failed, seconds).
+    """
+    logger = logging.getLogger(__name__)
+    out = ArchiveOutput(output) if output.endswith('.zip') else FolderOutput(output)
+    options = [dither_mode,rotate,align,image.PIPELINE_VERSION]
+
+    todo = []
+    skipped = 0
+    for path in find_images(folder):
+        name = output_name(folder,path)
+        key = source_key(path,options)
+        if not force and out.has(name,key):
+            skipped += 1
+        else:
+            todo.append((path,name,key))
+
+    converted = failed = 0
+    start = monotonic()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(convert_one,path,dither_mode,rotate,align) for path,name,key in todo]
+        for (path,name,key),future in zip(todo,futures):
+            try:
+                out.write(name,key,future.result())
+                logger.info('converted {}'.format(path))
+                converted += 1
+            except Exception as e:
+                logger.warning('could not convert {}: {}'.format(path,e))
+                failed += 1
+    out.close()
+    return converted,skipped,failed,monotonic() - start
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a folder of images to gbtile data')
+    parser.add_argument('-r', '--rotate',
+                        dest="rotate",
+                        default='auto',
+                        choices=['auto','portrait','landscape','none'],
+                        help="How to rotate the image"
+                        )
+    parser.add_argument('-d', '--dithering',
+                        dest="dither",
+                        default='bayer',
+                        choices=image.dither_factory.modes,
+                        help="Dithering algorithm to use"
+                        )
+    parser.add_argument('-a', '--align',
+                        dest="align",
+                        default='center',
+                        choices=['center','top','bottom'],
+                        help="Alignment of image with padding"
+                        )
+    parser.add_argument('-o', '--output',
+                        dest="output",
+                        default='gbtile',
+                        help="Output folder, or a .zip file for a single archive"
+                        )
+    parser.add_argument('-j', '--jobs',
+                        dest="jobs",
+                        default=None,
+                        type=int,
+                        help="Worker processes, defaults to one per core"
+                        )
+    parser.add_argument('-f', '--force',
+                        dest="force",
+                        action='store_true',
+                        help="Convert everything, even unchanged images"
+                        )
+    parser.add_argument('folder')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    converted,skipped,failed,seconds = convert_folder(args.folder,args.output,args.dither,args.rotate,
+                                                      args.align,args.jobs,args.force)
+    rate = converted/seconds if seconds else 0
+    print('{} converted, {} unchanged, {} failed, {:.2f} s, {:.1f} images/s'.format(converted,skipped,failed,seconds,rate))
+    if failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+Cache of converted tile data, so images printed over and over skip the
+decode, resize and dither steps. Entries are keyed by a hash of the source
+image and the conversion options, kept in a small in-memory LRU and in a
+size-bounded folder on disk that is read back through mmap.
+"""
+from . import image
+from collections import OrderedDict
+from PIL import Image
+import threading
+import hashlib
+import io
+import mmap
+import os
+
+def default_directory():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_dir,'gbprinter','tiles')
+
+class TileCache:
+
+    def __init__(self,directory=None,max_bytes=64*1024*1024,memory_items=32):
+        self.directory = directory or default_directory()
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        os.makedirs(self.directory,exist_ok=True)
+
+    @property
+    def hits(self):
+        return self.memory_hits + self.disk_hits
+
+    @property
+    def stats(self):
+        return {'hits':self.hits, 'memory_hits':self.memory_hits,
+                'disk_hits':self.disk_hits, 'misses':self.misses}
+
+    def key(self,source,dither_mode='bayer',rotate='auto',align='center'):
+        """
+        sha256 of the source (file contents, raw file bytes, or a PIL
+        image's pixels and palette) plus everything that changes the output
+        """
+        h = hashlib.sha256()
+        if isinstance(source,str):
+            with open(source,'rb') as f:
+                for chunk in iter(lambda: f.read(1 << 20),b''):
+                    h.update(chunk)
+        elif isinstance(source,(bytes,bytearray,memoryview)):
+            h.update(source)
+        else:
+            h.update('{} {}'.format(source.mode,source.size).encode())
+            h.update(source.tobytes())
+            palette = source.getpalette()
+            if palette != None:
+                h.update(bytes(palette))
+        h.update('|{}|{}|{}|{}'.format(dither_mode,rotate,align,image.PIPELINE_VERSION).encode())
+        return h.hexdigest()
+
+    def _path(self,key):
+        return os.path.join(self.directory,key[:2],key + '.gbtile')
+
+    def _remember(self,key,data):
+        self._memory[key] = data
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_items:
+            self._memory.popitem(last=False)
+
+    def get(self,key):
+        """
+        The cached tile data as a bytes-like object, or None. Disk entries
+        come back memory-mapped rather than copied.
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+
+            path = self._path(key)
+            try:
+                with open(path,'rb') as f:
+                    data = mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                os.utime(path) #most recently used, for eviction
+            except (OSError,ValueError):
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key,data)
+            return data
+
+    def put(self,key,data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path),exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path,threading.get_ident())
+        with open(tmp,'wb') as f:
+            f.write(data)
+        os.replace(tmp,path)
+        with self._lock:
+            self._remember(key,bytes(data))
+        self.evict()
+
+    def evict(self):
+        """
+        Deletes least recently used files until the store fits in max_bytes
+        """
+        entries = []
+        total = 0
+        for root,dirs,files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.gbtile'):
+                    path = os.path.join(root,name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    entries.append((stat.st_mtime,stat.st_size,path))
+                    total += stat.st_size
+        for mtime,size,path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        for root,dirs,files in os.walk(self.directory):
+            for name in files:
+                if name.endswith('.gbtile'):
+                    os.remove(os.path.join(root,name))
+
+    def image_to_gbtile(self,source,dither_mode='bayer',rotate='auto',align='center'):
+        """
+        Same as image.image_to_gbtile, but converts only on a cache miss.
+        source can also be the contents of an image file. Always returns
+        bytes, use get for the memory-mapped data.
+        """
+        key = self.key(source,dither_mode,rotate,align)
+        data = self.get(key)
+        if data == None:
+            if isinstance(source,(bytes,bytearray,memoryview)):
+                source = Image.open(io.BytesIO(source))
+            data = image.image_to_gbtile(source,dither_mode,rotate,align)
+            self.put(key,data)
+        return bytes(data)
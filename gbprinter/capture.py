@@ -0,0 +1,201 @@
+"""
+Recording what crosses the serial link, and playing it back. A capture file
+is the magic bytes followed by records appended as they happen, each one
+
+    kind (1 byte), nanoseconds since START (8), payload length (4), payload
+
+all little-endian. Kinds are START (wall clock time and who recorded it),
+IN and OUT (raw bytes read from and written to the port) and PACKET (an
+index entry: bytes read so far for an emulator, or written so far for a
+controller, then packet type and data size).
+
+Pass capture='file.gbcap' to Emulator or Controller to record, and replay()
+to push a capture back through an Emulator with no hardware attached.
+"""
+from time import monotonic_ns, perf_counter
+import struct
+import atexit
+import time
+import os
+
+MAGIC = b'GBPCAP\x01'
+RECORD = struct.Struct('<BQI')
+PACKET_ENTRY = struct.Struct('<QBH')
+
+START = 0
+IN = 1
+OUT = 2
+PACKET = 3
+
+class CaptureWriter:
+    """
+    Appends records to a capture file. Writes go through the file's own
+    buffer, nothing is flushed until close().
+    """
+
+    def __init__(self,filename,source):
+        self.filename = filename
+        new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self._file = open(filename,'ab')
+        if new:
+            self._file.write(MAGIC)
+        self.source = source
+        self._start = monotonic_ns()
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self._record(START,struct.pack('<d',time.time()) + source.encode('ascii'))
+        atexit.register(self.close)
+
+    def _record(self,kind,payload):
+        self._file.write(RECORD.pack(kind,monotonic_ns() - self._start,len(payload)))
+        self._file.write(payload)
+
+    def read(self,data):
+        if data:
+            self._record(IN,data)
+            self.bytes_read += len(data)
+
+    def write(self,data):
+        self._record(OUT,data)
+        self.bytes_written += len(data)
+
+    def packet(self,type,data_size):
+        offset = self.bytes_read if self.source == 'emulator' else self.bytes_written
+        self._record(PACKET,PACKET_ENTRY.pack(offset,type,data_size))
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        atexit.unregister(self.close)
+
+def open_capture(capture,source):
+    """
+    capture is a filename or an already open CaptureWriter
+    """
+    if isinstance(capture,str):
+        return CaptureWriter(capture,source)
+    return capture
+
+class RecordingSerial:
+    """
+    Wraps a serial port, recording everything read from and written to it
+    """
+
+    def __init__(self,port,capture):
+        self.port = port
+        self.capture = capture
+
+    def read(self,size=1):
+        data = self.port.read(size)
+        self.capture.read(data)
+        return data
+
+    def write(self,data):
+        self.capture.write(data)
+        return self.port.write(data)
+
+    def __getattr__(self,name):
+        return getattr(self.port,name)
+
+def iter_records(filename):
+    """
+    (kind, seconds since START, payload) for every record in a capture
+    """
+    with open(filename,'rb') as f:
+        data = f.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('{} is not a capture file'.format(filename))
+    view = memoryview(data)
+    pos = len(MAGIC)
+    while pos + RECORD.size <= len(data):
+        kind,t,size = RECORD.unpack_from(data,pos)
+        pos += RECORD.size
+        if pos + size > len(data):
+            break #cut off mid-record, e.g. by a crash
+        yield kind,t/1e9,view[pos:pos+size]
+        pos += size
+
+def source(filename):
+    """
+    'emulator' or 'controller', whoever recorded the first session
+    """
+    for kind,t,payload in iter_records(filename):
+        if kind == START:
+            return bytes(payload[8:]).decode('ascii')
+
+def packet_index(filename):
+    """
+    (seconds, byte offset, type, data size) of each packet recorded
+    """
+    return [(t,) + PACKET_ENTRY.unpack(payload)
+            for kind,t,payload in iter_records(filename) if kind == PACKET]
+
+def gb_stream(filename):
+    """
+    The capture as the chunks of 4-byte (rx, tx, state, remain) records the
+    emulator's Arduino would send. Controller captures are converted from
+    the frames the controller wrote.
+    """
+    if source(filename) == 'emulator':
+        return [bytes(payload) for kind,t,payload in iter_records(filename) if kind == IN]
+    chunks = []
+    for kind,t,payload in iter_records(filename):
+        if kind == OUT:
+            if payload[0] == 0x42 and len(payload) > 3: #bulk marker and length
+                payload = payload[3:]
+            records = bytearray(4*len(payload))
+            records[0::4] = payload
+            chunks.append(bytes(records))
+    return chunks
+
+class ReplaySerial:
+    """
+    Serial-like object handing out recorded chunks as fast as they are
+    read, and swallowing writes
+    """
+
+    def __init__(self,chunks):
+        self.chunks = chunks
+        self._chunk = 0
+        self._pos = 0
+        self.written = 0
+
+    @property
+    def done(self):
+        return self._chunk >= len(self.chunks)
+
+    @property
+    def in_waiting(self):
+        return 0 if self.done else len(self.chunks[self._chunk]) - self._pos
+
+    def read(self,size=1):
+        if self.done:
+            return b''
+        chunk = self.chunks[self._chunk]
+        data = chunk[self._pos:self._pos+size]
+        self._pos += len(data)
+        if self._pos == len(chunk):
+            self._chunk += 1
+            self._pos = 0
+        return data
+
+    def write(self,data):
+        self.written += len(data)
+        return len(data)
+
+    def close(self):
+        pass
+
+def replay(filename,emulator_factory):
+    """
+    Feeds a capture through emulator_factory(port)'s get_gb_data as fast as
+    it goes. Returns (emulator, Game Boy bytes, seconds).
+    """
+    chunks = gb_stream(filename)
+    port = ReplaySerial(chunks)
+    emu = emulator_factory(port)
+    start = perf_counter()
+    while not port.done:
+        emu.get_gb_data()
+    seconds = perf_counter() - start
+    return emu,sum(len(c) for c in chunks)//4,seconds
@@ -0,0 +1,117 @@
+"""
+Command line printing, run as python -m gbprinter. Nothing heavy is
+imported until the arguments say it's needed, so --help is instant and
+conversion-only runs never load pyserial.
+
+    python -m gbprinter cat.png                  print it
+    python -m gbprinter cat.png -n               convert only, report pages
+    python -m gbprinter cat.png -o cat.gbtile    save tile data (or .png preview)
+"""
+from time import perf_counter
+import argparse
+import logging
+import sys
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m gbprinter',description='Print on a Game Boy Printer!')
+    parser.add_argument('-r', '--rotate',
+                        dest="rotate",
+                        default='auto',
+                        choices=['auto','portrait','landscape','none'],
+                        help="How to rotate the image"
+                        )
+    parser.add_argument('-d', '--dithering',
+                        dest="dither",
+                        default='bayer',
+                        help="Dithering algorithm to use: bayer (default), equalbins, nearest, "
+                             "floydsteinberg, atkinson or jjn"
+                        )
+    parser.add_argument('-a', '--align',
+                        dest="align",
+                        default='center',
+                        choices=['center','top','bottom'],
+                        help="Alignment of image with padding"
+                        )
+    parser.add_argument('-p', '--port',
+                        dest="port",
+                        default=None,
+                        help="Serial port of the printer, searched for if not given"
+                        )
+    parser.add_argument('-b', '--batched',
+                        dest="batched",
+                        action='store_true',
+                        help="Send whole packets at once, needs the bulk mode of controller_arduino"
+                        )
+    parser.add_argument('-z', '--compress',
+                        dest="compress",
+                        action='store_true',
+                        help="RLE compress image data when it helps"
+                        )
+    parser.add_argument('-t', '--ready-timeout',
+                        dest="ready_timeout",
+                        default=5,
+                        type=float,
+                        help="Seconds to wait for the printer to answer"
+                        )
+    parser.add_argument('-n', '--dry-run',
+                        dest="dry_run",
+                        action='store_true',
+                        help="Convert the image but don't print it"
+                        )
+    parser.add_argument('-o', '--output',
+                        dest="output",
+                        default=None,
+                        help="Save the converted image instead of printing, as tile data or, for .png, a preview"
+                        )
+    parser.add_argument('-v', '--verbose',
+                        dest="verbose",
+                        action='store_true',
+                        help="Log every packet"
+                        )
+    parser.add_argument('filename')
+    return parser
+
+def convert(args):
+    from . import image
+    start = perf_counter()
+    gbtile = b''.join(image.iter_gbtile_pages(args.filename,args.dither,args.rotate,args.align))
+    seconds = perf_counter() - start
+    if args.output != None:
+        if args.output.lower().endswith('.png'):
+            image.twobit_to_image(image.gbtile_to_twobit(gbtile)).save(args.output)
+        else:
+            with open(args.output,'wb') as f:
+                f.write(gbtile)
+    print('{}: {} pages, converted in {:.2f} s'.format(args.filename,len(gbtile)//640,seconds))
+
+def print_image(args):
+    from .controller import Controller
+    from .printjob import PrintJob
+    logger = logging.getLogger(__name__)
+    start = perf_counter()
+    printer = Controller(args.port,batched=args.batched,compression=args.compress,
+                         ready_timeout=args.ready_timeout)
+    logger.info('printer ready after {:.2f} s'.format(perf_counter() - start))
+    job = PrintJob.from_image(printer,args.filename,args.dither,args.rotate,args.align)
+    pages = job.run()
+    logger.info('printed {} pages'.format(pages))
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO)
+
+    from . import image
+    if args.dither not in image.dither_factory.modes:
+        parser.error('unknown dithering {}, choose from {}'.format(args.dither,', '.join(image.dither_factory.modes)))
+
+    try:
+        if args.dry_run or args.output != None:
+            convert(args)
+        else:
+            print_image(args)
+    except IOError as e:
+        print('{}: {}'.format(parser.prog,e),file=sys.stderr)
+        return 1
+    return 0
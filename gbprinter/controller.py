@@ -1,59 +1,66 @@
-import serial
-from time import sleep
-import platform
+from . import image
+from . import ports
+from . import metrics
+from .capture import open_capture, RecordingSerial
+from time import monotonic
 import logging
 
+def build_frame(cmd,compression=0,packet=None):
+    """
+    Magic bytes, header, packet and checksum as one bytestring, without
+    the two trailing response bytes
+    """
+    packet = b'' if packet == None else bytes(packet)
+    header = bytes([cmd,compression]) + len(packet).to_bytes(2,byteorder='little')
+    checksum = (sum(header) + sum(packet)) % 0x10000
+    return b'\x88\x33' + header + packet + checksum.to_bytes(2,byteorder='little')
+
+def printer_handshake(gbp_serial):
+    response = Controller(gbp_serial).cmd_status()
+    return response[0] in [0x80,0x81]
+
 class Controller:
 
-    def __init__(self,port=None):
+    #sent ahead of a whole frame when batched, see controller_arduino.ino
+    bulk_marker = 0x42
+
+    def __init__(self,port=None,batched=False,compression=False,capture=None,
+                 ready_timeout=ports.HANDSHAKE_TIMEOUT):
+        """
+        port can be a port name, an already-open serial-like object, or None
+        to search for the printer. batched=True sends each packet in a single
+        write and reads the echo back in bulk, and needs the bulk mode of
+        controller_arduino. compression=True RLE-compresses DATA packets
+        whenever that makes them smaller. capture is a filename (or
+        capture.CaptureWriter) to record everything sent and received to.
+        A named port is polled until the printer answers, for at most
+        ready_timeout seconds.
+        """
         self.logger = logging.getLogger(__name__)
+        self.batched = batched
+        self.compression = compression
 
         if port == None:
-            self.find_serial()
+            self.find_serial(ready_timeout)
+        elif not isinstance(port,str):
+            self.gbp_serial = port
         else:
             self.logger.info('Printer on {} you say?'.format(port))
-            self.gbp_serial = serial.Serial(port,baudrate=115200,timeout=.2)
-            self.logger.info('sleep for 2 seconds to prep serial...')
-            sleep(2.5)
-        
-
-
-    def find_serial(self):
-        opsys = platform.system()
-        if opsys == 'Windows':
-            ports = ['COM%s' % (i + 1) for i in range(1,256)]
-        elif opsys == 'Linux':
-            ports = glob.glob('/dev/tty[A-Za-z]*')
-        elif opsys == 'Darwin':
-            ports = glob.glob('/dev/tty.*')
-        else:
-            raise EnvironmentError('Not Windows, Mac, or Linux, dunno where your serial ports would be')
-
-        good_ports = []
-        for port in ports:
-            try:
-                s = serial.Serial(port)
-                s.close()
-                good_ports.append(port)
-            except (OSError, serial.SerialException):
-                pass
-
-        self.logger.info('good ports are ' + ','.join(good_ports))
-
-        best_port = None
-        for port in good_ports:
-            self.gbp_serial = serial.Serial(port,baudrate=115200,timeout=.2)
-            self.logger.info('checking port ' + port)
-            sleep(2)
-            response = self.cmd_status()
-            if response[0] in [0x80,0x81]:
-                best_port = port
-                break
-
-        if best_port == None:
+            self.gbp_serial = ports.probe(port,printer_handshake,ready_timeout)
+            if self.gbp_serial == None:
+                raise IOError('No printer answering on {}'.format(port))
+        self.capture = None
+        if capture != None:
+            self.capture = open_capture(capture,'controller')
+            self.gbp_serial = RecordingSerial(self.gbp_serial,self.capture)
+
+
+    def find_serial(self,timeout=ports.HANDSHAKE_TIMEOUT):
+        self.gbp_serial,port = ports.find_port('printer',printer_handshake,timeout)
+        if port == None:
             raise IOError("Can't find printer!")
         else:
-            self.logger.info('GBP found on port ' + best_port)
+            self.logger.info('GBP found on port ' + port)
 
 
     def send_byte(self,byte):
@@ -82,36 +89,49 @@ class Controller:
         if cmd not in self.commands:
             raise ValueError('Invalid command type: {}'.format(cmd))
 
-        self.logger.debug('Sending {} command'.format(self.commands[cmd]))
+        name = self.commands[cmd]
+        self.logger.debug('Sending %s command',name)
+        metrics.count('controller_commands',command=name)
+
+        frame = self.build_frame(cmd,compression,packet)
+        if self.capture != None:
+            self.capture.packet(cmd,len(frame)-8)
+        with metrics.timer('send',command=name):
+            if self.batched:
+                response = self.send_frame(frame)
+            else:
+                for byte in frame:
+                    self.send_byte(byte)
+                response = self.get_response()
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug('Received 0x%02x 0x%02x',response[0],response[1])
+            self.logger.debug('%s',self.translate_status(response))
 
-        #magic bytes
-        self.send_byte(0x88)
-        self.send_byte(0x33)
-
-        #header
-        self.send_byte(cmd)
-        self.send_byte(compression)
-        packet_size = 0 if packet == None else len(packet)
-        size_chk = self.send_two_bytes(packet_size)
-
-        #packet, if present
-        packet_chk = 0
-        if packet != None:
-            for byte in packet:
-                self.send_byte(byte)
-                packet_chk += byte
-
-        #checksum
-        checksum = (cmd + compression + sum(size_chk) + packet_chk) % 0x10000
-        self.send_two_bytes(checksum)
-
-        #response
-        response = self.get_response()
-
-        self.logger.debug('Received {} {}'.format(hex(response[0]),hex(response[1])))
-        self.logger.debug(self.translate_status(response))
+        return response
 
-        return response       
+    def build_frame(self,cmd,compression=0,packet=None):
+        return build_frame(cmd,compression,packet)
+
+    def send_frame(self,frame):
+        """
+        Send a whole frame plus the two response bytes in one write, then
+        read every echoed byte back at once. Only the last two matter.
+        """
+        frame = frame + bytes(2)
+        self.gbp_serial.write(bytes([self.bulk_marker]) + len(frame).to_bytes(2,byteorder='little') + frame)
+        echo = self.read_bulk(len(frame))
+        if len(echo) != len(frame):
+            raise IOError('Expected {} bytes from printer, got {}'.format(len(frame),len(echo)))
+        return [echo[-2],echo[-1]]
+
+    def read_bulk(self,size):
+        #the arduino clocks each byte out at ~1.2 ms, so allow for that
+        deadline = monotonic() + 1 + size*0.002
+        data = b''
+        while len(data) < size and monotonic() < deadline:
+            data += self.gbp_serial.read(size - len(data))
+        return data
 
     def send_two_bytes(self,num):
         low,high = (num % 0x100, (num >> 8) % 0x100)
@@ -134,7 +154,13 @@ class Controller:
         packet = bytes([pages,margin,palette,exposure])
         return self.send_command(0x02,packet=packet)
 
-    def cmd_data(self,packet=None):
+    def cmd_data(self,packet=None,compression=None):
+        if compression == None:
+            compression = self.compression
+        if compression and packet:
+            compressed = image.rle_compress(packet)
+            if len(compressed) < len(packet):
+                return self.send_command(0x04,compression=1,packet=compressed)
         return self.send_command(0x04,packet=packet)
 
     def cmd_break(self):
@@ -1,9 +1,11 @@
 from . import image
-import serial
-from time import sleep
-import platform
+from . import ports
+from . import metrics
+from .capture import open_capture, RecordingSerial
+from .writer import ImageWriter
 import logging
-from enum import Enum
+import numpy as np
+from PIL import Image
 from collections import defaultdict
 
 CHECKSUM_ERROR = 0
@@ -15,28 +17,87 @@ PAPER_JAM = 5
 OTHER_ERROR = 6
 LOW_BATTERY = 7
 
+def arduino_handshake(gbp_serial):
+    gbp_serial.write(bytes([105]))
+    return gbp_serial.read(4) == b'nice'
+
 class Emulator:
 
-        def __init__(self,port=None,palette=image.PALETTES['gray']):
+        def __init__(self,port=None,palette=image.PALETTES['gray'],writer=None,capture=None,
+                     ready_timeout=ports.HANDSHAKE_TIMEOUT):
             self.logger = logging.getLogger(__name__)
             self.palette = palette
-            self.current_packet = Packet()
+            self.writer = writer if writer != None else ImageWriter()
+            self.parser = PacketParser()
+            self._partial_record = b''
 
             if port == None:
-                self.find_serial()
+                self.find_serial(ready_timeout)
+            elif not isinstance(port,str):
+                self.gbp_serial = port
             else:
                 self.logger.info('Printer on {} you say?'.format(port))
-                self.gbp_serial = serial.Serial(port,baudrate=115200,timeout=.2)
-                self.logger.info('sleep for 2 seconds to prep serial...')
-                sleep(2)
+                self.gbp_serial = ports.probe(port,arduino_handshake,ready_timeout)
+                if self.gbp_serial == None:
+                    raise IOError('No Arduino answering on {}'.format(port))
+            self.capture = None
+            if capture != None:
+                self.capture = open_capture(capture,'emulator')
+                self.gbp_serial = RecordingSerial(self.gbp_serial,self.capture)
             self.init_buffer()
-            self._fullimage = b''
+            self.init_image()
 
         def init_buffer(self):
             self._status = b'\x00'
-            self._buffer = b''
+            self._buffer = bytearray()
             self._print_fake = 0
 
+        def init_image(self,capacity=16*9):
+            """
+            The image printed so far is kept decoded, in a twobit array that
+            doubles in size when it fills up, and rendered, in a paletted
+            preview grown the same way, so each PRINT only decodes and renders
+            the pages it adds
+            """
+            self._image = np.empty((capacity,160),dtype=np.uint8)
+            self._image_rows = 0
+            self._preview = Image.new('P',(160,capacity))
+
+        def add_pages(self,gbtile_bytes):
+            rows = image.gbtile_to_twobit(gbtile_bytes)
+            start = self._image_rows
+            end = start + len(rows)
+            if end > len(self._image):
+                capacity = max(end,2*len(self._image))
+                grown = np.empty((capacity,160),dtype=np.uint8)
+                grown[:start] = self._image[:start]
+                self._image = grown
+                preview = Image.new('P',(160,capacity))
+                preview.paste(self._preview.crop((0,0,160,start)))
+                self._preview = preview
+            self._image[start:end] = rows
+            self._image_rows = end
+            if len(rows):
+                new = image.twobit_to_image(rows,palette=self.palette)
+                self._preview.paste(new,(0,start))
+                self._preview.putpalette(new.getpalette())
+
+        @property
+        def twobit(self):
+            """
+            Everything printed since the last full image, as a twobit array.
+            This is a view, it changes as more pages are printed.
+            """
+            return self._image[:self._image_rows]
+
+        def render(self):
+            """
+            Everything printed since the last full image, as a paletted PIL
+            image. Only cropped from the preview, which add_pages keeps
+            rendered.
+            """
+            return self._preview.crop((0,0,160,self._image_rows))
+
         @property
         def status(self):
             return [self._status[0]>>i & 0x01 for i in range(8)]
@@ -60,61 +121,47 @@ class Emulator:
         def get_status(self,bit):
             return bool(self._status[0] & 2**bit)
         
-        def find_serial(self):
-            opsys = platform.system()
-            if opsys == 'Windows':
-                ports = ['COM%s' % (i + 1) for i in range(2,256)]
-            elif opsys == 'Linux':
-                ports = glob.glob('/dev/tty[A-Za-z]*')
-            elif opsys == 'Darwin':
-                ports = glob.glob('/dev/tty.*')
-            else:
-                raise EnvironmentError('Not Windows, Mac, or Linux, dunno where your serial ports would be')
-
-            good_ports = []
-            for port in ports:
-                try:
-                    s = serial.Serial(port)
-                    s.close()
-                    good_ports.append(port)
-                except (OSError, serial.SerialException):
-                    pass
-
-            self.logger.info('good ports are ' + ','.join(good_ports))
-
-            best_port = None
-            for port in good_ports:
-                self.gbp_serial = serial.Serial(port,baudrate=115200,timeout=.2)
-                self.logger.info('checking port ' + port)
-                sleep(2)
-                self.gbp_serial.write(bytes([105]))
-                response = self.gbp_serial.read(4)
-                if response == b'nice':
-                    best_port = port
-                    break
-                else:
-                    self.gbp_serial.close()
-
-            if best_port == None:
+        def find_serial(self,timeout=ports.HANDSHAKE_TIMEOUT):
+            self.gbp_serial,port = ports.find_port('emulator',arduino_handshake,timeout)
+            if port == None:
                 raise IOError("Can't find Arduino!")
             else:
-                self.logger.info('Arduino found on port ' + best_port)
+                self.logger.info('Arduino found on port ' + port)
 
         def get_gb_data(self):
-            packet = self.current_packet
-            from_gb = self.gbp_serial.read(4)
+            """
+            Reads everything the Arduino has sent so far, at least one record.
+            Each byte from the Game Boy arrives as a 4-byte record of
+            (rx, tx, state, remain); only rx goes to the packet parser.
+            """
+            waiting = self.gbp_serial.in_waiting
+            from_gb = self.gbp_serial.read(max(waiting,4))
             if from_gb:
-                rx,tx,ard_state,data_remain = from_gb     
-                packet.add_byte(rx)
-                if packet.status == Status.COMPLETE:
-                    self.handle_packet(packet)
-                    self.current_packet = Packet()
+                self.handle_records(from_gb)
+
+        def handle_records(self,from_gb):
+            records = self._partial_record + from_gb
+            usable = len(records) - len(records) % 4
+            self._partial_record = records[usable:]
+            rx = memoryview(records)[0:usable:4]
+            for packet in self.parser.feed(rx):
+                self.handle_packet(packet)
 
         def handle_packet(self,packet):
-            self.logger.info('Packet received, type {}, data size {}'.format(packet.type,packet.data_size))
+            if metrics.active == None:
+                self._handle_packet(packet)
+            else:
+                metrics.count('emulator_packets',type=packet.type_text)
+                with metrics.timer('handle_packet'):
+                    self._handle_packet(packet)
+
+        def _handle_packet(self,packet):
+            self.logger.info('Packet received, type %s, data size %s',packet.type,packet.data_size)
             if packet.data_size == 4:
-                self.logger.debug('Print data 0x{:02x} 0x{:02x} 0x{:02x} 0x{:02x}'.format(*packet.data))
-            #self.logger.debug('Checksum is {}'.format(self.current_packet.verify_checksum()))
+                self.logger.debug('Print data 0x%02x 0x%02x 0x%02x 0x%02x',*packet.data)
+            #self.logger.debug('Checksum is {}'.format(packet.verify_checksum()))
+            if self.capture != None:
+                self.capture.packet(packet.type,packet.data_size)
 
             if packet.type == 1: #init
                 if not self.get_status(1): #if not currently printing
@@ -125,12 +172,12 @@ class Emulator:
                 self.set_status(IMAGE_FULL)
                 self.set_status(UNPROCESSED_DATA,False)
                 end_margin = packet.data[1] % 16
-                self._fullimage += self._buffer
-                image_mat = image.gb_tile_to_matrix(self._fullimage)
-                image_obj = image.matrix_to_image(image_mat,save=True,palette=self.palette)
+                self.add_pages(self._buffer)
                 if end_margin != 0:
                     self.logger.info('Full image sent!')
-                    self._fullimage = b''
+                    #init_image starts a new array, so the writer can keep this one
+                    self.writer.write(self.twobit,self.palette)
+                    self.init_image()
                 else:
                     self.logger.info('Partial image sent!')
 
@@ -142,14 +189,19 @@ class Emulator:
                     elif self.pages >= 9:
                         self.set_status(PACKET_ERROR)
                     else:
-                        if packet.header[1]: #if compression
-                            data = self.decompress(packet.data)
+                        try:
+                            if packet.header[1]: #if compression
+                                data = self.decompress(packet.data)
+                            else:
+                                data = packet.data
+                        except ValueError as e:
+                            self.logger.warning('Bad compressed packet: {}'.format(e))
+                            self.set_status(PACKET_ERROR)
                         else:
-                            data = packet.data
-                        self._buffer = self._buffer + bytes(data)
-                        self.set_status(UNPROCESSED_DATA)
-                    self.logger.debug('Number of pages in buffer: {}'.format(self.pages))
-                    self.logger.debug('Number of bytes in buffer: {}'.format(len(self._buffer)))
+                            self._buffer += data
+                            self.set_status(UNPROCESSED_DATA)
+                    self.logger.debug('Number of pages in buffer: %s',self.pages)
+                    self.logger.debug('Number of bytes in buffer: %s',len(self._buffer))
 
             elif packet.type == 8: #break
                 if self.get_status(PRINTING):
@@ -167,43 +219,19 @@ class Emulator:
                         self.init_buffer()
 
             self.gbp_serial.write(self._status)
-            self.logger.debug('My status is: {}'.format(self.status))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug('My status is: %s',self.status)
 
         def decompress(self,comp_data):
-            len_comp = len(comp_data)
-            raw_data = [0]*640
-            comp_offset = 0
-            raw_offset = 0
-            while comp_offset < len(comp_data):
-                command_byte = comp_data[comp_offset]
-                comp_offset += 1
-                if command_byte & 0x80: #compressed run
-                    length = command_byte - 0x80 + 2
-                    duped_byte = comp_data[comp_offset]
-                    comp_offset += 1
-                    raw_data[raw_offset:raw_offset+length] = [duped_byte]*length
-                    raw_offset += length
-                else: #uncompressed run
-                    length = command_byte + 1
-                    unduped_data = comp_data[comp_offset:comp_offset+length]
-                    comp_offset += length
-                    raw_data[raw_offset:raw_offset+length] = unduped_data
-                    raw_offset += length
-            return raw_data
-
-
-class Status(Enum):
-    EMPTY = 0
-    PREAMBLE_PARTIAL = 1
-    PREAMBLE_DONE = 2
-    HEADER_PARTIAL = 3
-    HEADER_DONE = 4
-    DATA_PARTIAL = 5
-    DATA_DONE = 6
-    CHECKSUM_PARTIAL = 7
-    CHECKSUM_DONE = 8
-    RESPONSE_PARTIAL = 9
-    COMPLETE = 10
+            return image.rle_decompress(comp_data)
+
+
+#parser states
+EMPTY = 0
+PREAMBLE = 1
+HEADER = 2
+DATA = 3
+TRAILER = 4
 
 def unknown(): return 'UNKNOWN'
 
@@ -217,113 +245,120 @@ p_type[0xF] = 'STATUS'
 
 
 class Packet:
-    def __init__(self):
-        if not hasattr(self, 'logger'):
-            self.logger = logging.getLogger(__name__)
-        self._raw_data = [0]*10 # size of a dataless packet
-        self._status = Status.EMPTY
-        self._bytes_stored = 0
-        self._checksum = 0
-
-    @property
-    def raw_data(self):
-        return self._raw_data
-
-    @property
-    def status(self):
-        return self._status
-
-    @property
-    def header(self):
-        return self._raw_data[2:6]
-    
-    @property
-    def data(self):
-        return self._raw_data[6:6+self.data_size]
-
-    @property
-    def checksum(self):
-        return sum(self._raw_data[2:6+self.data_size]) % (256*256)
-    
-    @property
-    def rx_checksum(self):
-        return self._raw_data[-4] + self._raw_data[-3]*256
-
-    @property
-    def data_size(self):
-        return self._raw_data[4] + self._raw_data[5]*256
-
-    @property
-    def type(self):
-        return self._raw_data[2]
+    """
+    One complete packet from the Game Boy: preamble, header, data, checksum
+    and the two response bytes. Fields are decoded once, up front.
+    """
+    __slots__ = ['raw_data','header','data','type','data_size','checksum','rx_checksum']
+
+    def __init__(self,raw_data,checksum=None):
+        self.raw_data = raw_data
+        self.header = raw_data[2:6]
+        self.type = raw_data[2]
+        self.data_size = raw_data[4] + raw_data[5]*256
+        self.data = raw_data[6:6+self.data_size]
+        if checksum == None:
+            checksum = sum(raw_data[2:6+self.data_size]) % (256*256)
+        self.checksum = checksum
+        self.rx_checksum = raw_data[-4] + raw_data[-3]*256
 
     @property
     def type_text(self):
-        return p_type[self._raw_data[2]]
-     
+        return p_type[self.type]
 
     def verify_checksum(self):
         return self.checksum == self.rx_checksum
 
-    def _raw_add_byte(self,byte):
-        if self._bytes_stored >= len(self._raw_data):
-            raise ValueError('Packet cannot accept more bytes (raw)')
-        self._raw_data[self._bytes_stored] = byte
-        self._bytes_stored += 1
-    
-    def add_bytes(self,*bytes):
-        for byte in bytes:
-            self.add_byte(byte)
-
-    def add_byte(self,rx):
-        if self._status == [Status.COMPLETE]:
-            raise ValueError('Packet cannot accept more bytes')
-
-        if self._status == Status.EMPTY:
-            if rx == 0x88:
-                self._raw_add_byte(rx)
-                self._status = Status.PREAMBLE_PARTIAL
-
-        elif self._status == Status.PREAMBLE_PARTIAL:
-            if rx == 0x33:
-                self._raw_add_byte(rx)
-                self._status = Status.PREAMBLE_DONE
-            else:
-                self.__init__()
-
-        elif self._status in [Status.PREAMBLE_DONE,Status.HEADER_PARTIAL]:
-            self._status = Status.HEADER_PARTIAL
-            self._raw_add_byte(rx)
-            if self._bytes_stored >= 6: #header is done
-                if self.data_size == 0:
-                    self._status = Status.DATA_DONE
-                else:
-                    temp_data = self._raw_data
-                    self._raw_data = [0]*(10+self.data_size)
-                    self._raw_data[0:6] = temp_data[0:6]
-                    self._status = Status.HEADER_DONE
-
-        elif self._status in [Status.HEADER_DONE,Status.DATA_PARTIAL]:
-            self._status = Status.DATA_PARTIAL
-            self._raw_add_byte(rx)
-            if self._bytes_stored >= 6 + self.data_size:
-                self._status = Status.DATA_DONE
-
-        elif self._status == Status.DATA_DONE:
-            self._raw_add_byte(rx)
-            self._status = Status.CHECKSUM_PARTIAL
-
-        elif self._status == Status.CHECKSUM_PARTIAL:
-            self._raw_add_byte(rx)
-            self._status = Status.CHECKSUM_DONE
 
-        elif self._status == Status.CHECKSUM_DONE:
-            self._raw_add_byte(rx)
-            self._status = Status.RESPONSE_PARTIAL
-
-        elif self._status == Status.RESPONSE_PARTIAL:
-            self._raw_add_byte(rx)
-            self._status = Status.COMPLETE
+class PacketParser:
+    """
+    Turns the byte stream from the Game Boy into Packets. Bytes go into one
+    reusable buffer, the checksum is summed as they arrive, and data bytes
+    are copied a whole chunk at a time.
+    """
+    __slots__ = ['_raw','_state','_pos','_end','_checksum']
 
+    def __init__(self):
+        self._raw = bytearray(10+640) # room for a full DATA packet
+        self._state = EMPTY
+        self._pos = 0
+        self._end = 0
+        self._checksum = 0
 
-        
\ No newline at end of file
+    def add_byte(self,rx):
+        return self.feed(bytes([rx]))
+
+    def feed(self,buf):
+        """
+        Consumes any number of bytes and returns the list of packets they
+        completed
+        """
+        if not isinstance(buf,(bytes,bytearray)):
+            buf = bytes(buf)
+        view = memoryview(buf)
+        packets = []
+        raw = self._raw
+        state = self._state
+        pos = self._pos
+        end = self._end
+        checksum = self._checksum
+        i = 0
+        n = len(buf)
+
+        while i < n:
+            if state == EMPTY:
+                i = buf.find(0x88,i)
+                if i < 0:
+                    break
+                raw[0] = 0x88
+                pos = 1
+                state = PREAMBLE
+                i += 1
+
+            elif state == PREAMBLE:
+                if buf[i] == 0x33:
+                    raw[1] = 0x33
+                    pos = 2
+                    state = HEADER
+                    i += 1
+                else: #not a packet after all, look for the next 0x88 here
+                    state = EMPTY
+
+            elif state == HEADER:
+                take = min(6-pos,n-i)
+                raw[pos:pos+take] = view[i:i+take]
+                pos += take
+                i += take
+                if pos == 6:
+                    data_end = 6 + raw[4] + raw[5]*256
+                    end = data_end + 4
+                    if end > len(raw):
+                        raw = self._raw = raw[:6] + bytearray(end-6)
+                    checksum = raw[2] + raw[3] + raw[4] + raw[5]
+                    state = DATA if data_end > 6 else TRAILER
+
+            elif state == DATA:
+                take = min(end-4-pos,n-i)
+                chunk = view[i:i+take]
+                raw[pos:pos+take] = chunk
+                checksum += sum(chunk)
+                pos += take
+                i += take
+                if pos == end-4:
+                    state = TRAILER
+
+            else: #checksum and response bytes
+                take = min(end-pos,n-i)
+                raw[pos:pos+take] = view[i:i+take]
+                pos += take
+                i += take
+                if pos == end:
+                    packets.append(Packet(bytes(raw[:end]),checksum % (256*256)))
+                    state = EMPTY
+                    pos = 0
+
+        self._state = state
+        self._pos = pos
+        self._end = end
+        self._checksum = checksum
+        return packets
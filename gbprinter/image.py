@@ -1,7 +1,13 @@
 from PIL import Image
 import time
 import numpy as np
-import math
+import functools
+from collections import deque
+from . import metrics
+
+#bump whenever a change to the conversion changes its output, so cached
+#tile data from older versions isn't reused
+PIPELINE_VERSION = 2
 
 def gray_resize(in_image,rotate='auto',align='center'):
     """
@@ -10,44 +16,89 @@ def gray_resize(in_image,rotate='auto',align='center'):
     to grayscale     
     """
 
-    if type(in_image) == str:
-        in_image = Image.open(in_image)
+    image,resample = prepare_image(in_image,rotate)
 
-    if in_image.mode == 'RGBA':
-        image = clear_transparent(in_image)
-    else:
-            image = in_image
-    
-    #then, rotation
+    #resize to 160 px wide, big sources get shrunk with reduce() first
+    new_h,final_h,offset = layout(image.size,align)
+    image = image.resize((160,new_h),resample=resample,reducing_gap=3.0)
+
+    #pad height to a multiple of 16
+    image_new = Image.new('L',(160,final_h),255)
+    if offset != None:
+        image_new.paste(image,(0,offset))
+
+    return image_new
+
+def needs_rotation(size,rotate='auto'):
+    w,h = size
     if rotate in ['auto','portrait']:
-        w,h = image.size
-        if w>h:
-            image = image.transpose(Image.ROTATE_270)
+        return w>h
     elif rotate == 'landscape':
-        w,h = image.size
-        if h>w:
-            image = image.transpose(Image.ROTATE_270)
+        return h>w
     elif rotate == 'none':
-        pass
+        return False
     else:
         raise ValueError('rotate must be auto, portrait, landscape, or none')
 
-    #resize to 160 px wide
-    w,h = image.size
-    new_h = int(160 * h / w)
-    image = image.resize((160,new_h),resample=Image.LANCZOS)
+def prepare_image(in_image,rotate='auto'):
+    """
+    Opens the image if needed, makes transparent pixels white, converts it to
+    grayscale and rotates it the way gray_resize would. Returns it along with
+    the resampling filter to scale it with: nearest neighbour for '1' and 'P'
+    images, like PIL would pick for those, LANCZOS otherwise.
 
-    #pad height to a multiple of 16
-    final_h = (new_h-1) // 16 * 16 + 16
-    image_new = Image.new('RGB',(160,final_h),(255,255,255))
-    if align == 'top':
-        image_new.paste(image,(0,0))
-    elif align == 'center':
-        image_new.paste(image,(0,(final_h-new_h)//2))
-    elif align == 'bottom':
-        image_new.paste(image,(0,final_h-new_h))
+    JPEG files opened here are decoded straight to grayscale at the smallest
+    1/2, 1/4 or 1/8 scale that is still twice as big as needed.
+    """
 
-    return to_gray(image_new)
+    opened = type(in_image) == str
+    if opened:
+        in_image = Image.open(in_image)
+
+    rotated = needs_rotation(in_image.size,rotate)
+    resample = Image.NEAREST if in_image.mode in ['1','P'] else Image.LANCZOS
+
+    if opened and in_image.format == 'JPEG':
+        w,h = in_image.size
+        scale = 2*160 / (h if rotated else w)
+        in_image.draft('L',(int(w*scale),int(h*scale)))
+
+    if in_image.mode == 'RGBA':
+        in_image = clear_transparent(in_image)
+    image = in_image if in_image.mode == 'L' else in_image.convert('L')
+
+    if rotated:
+        image = image.transpose(Image.ROTATE_270)
+
+    return image,resample
+
+def layout(size,align='center'):
+    """
+    For a source of the given size, returns the resized height at 160 px wide,
+    that height padded to a multiple of 16, and the row the resized image is
+    pasted at (None if align isn't recognised, leaving it blank)
+    """
+    w,h = size
+    new_h = int(160 * h / w)
+    final_h = (new_h-1) // 16 * 16 + 16
+    offsets = {
+        'top': 0,
+        'center': (final_h-new_h)//2,
+        'bottom': final_h-new_h,
+    }
+    return new_h,final_h,offsets.get(align)
+
+def iter_gray_bands(in_image,rotate='auto',align='center'):
+    """
+    Same result as gray_resize, yielded as 16x160 numpy arrays one band at
+    a time. The resize itself is done once for the whole image, since
+    resampling band by band rounds differently; at 160 bytes a row its
+    output is small next to the decoded source, and everything after it
+    works on one band at a time.
+    """
+    gray = np.asarray(gray_resize(in_image,rotate=rotate,align=align))
+    for top in range(0,len(gray),16):
+        yield gray[top:top+16]
 
 def clear_transparent(in_image):
     """
@@ -68,41 +119,166 @@ def to_gray(image):
 
     return image.convert('L')
 
-def bayer(image):
-    if type(image) == type(Image.new('RGB',(1,1))):
-        image = np.array(image)
+BAYER_COEFF = np.array([[ 0, 8, 2,10],
+                        [12, 4,14, 6],
+                        [ 3,11, 1, 9],
+                        [15, 7,13, 5]])
 
-    coeff = np.array([[ 0, 8, 2,10],
-                      [12, 4,14, 6],
-                      [ 3,11, 1, 9],
-                      [15, 7,13, 5]])
-
-    h,w = image.shape
-    num_tiles = tuple([math.ceil(x/4) for x in image.shape])
-    c = np.tile(coeff,num_tiles)[:h,:w]
+@functools.lru_cache(maxsize=None)
+def bayer_table():
+    """
+    4x4x256 lookup of the twobit value bayer gives each gray level at each
+    position of the 4x4 pattern
+    """
     r = 82 #magic number
+    gray = np.arange(256)
+    dithered = gray + r*(BAYER_COEFF[:,:,None]/16 - 1/2)
+    return (3 - np.round(dithered/85).astype(np.uint8)).astype(np.uint8)
 
-    image = image + r*(c/16 - 1/2)
-    image = 85 * np.round(image/85).astype(np.uint8)
+def bayer_twobit(image,row=0):
+    """
+    Ordered dither straight to a twobit array, one table lookup per pixel.
+    row is where the image starts within the full picture, so bands dithered
+    separately keep the pattern lined up
+    """
+    image = np.asarray(image)
+    if image.dtype != np.uint8:
+        image = np.clip(image,0,255).astype(np.uint8)
+    h,w = image.shape
+    rows = ((np.arange(h) + row) % 4)[:,None]
+    cols = (np.arange(w) % 4)[None,:]
+    return bayer_table()[rows,cols,image]
 
-    return image
+def bayer(image,row=0):
+    """
+    row is where the image starts within the full picture, so bands dithered
+    separately keep the pattern lined up
+    """
+    twobit = bayer_twobit(image,row)
+    twobit ^= 3
+    twobit *= 85
+    return twobit
 
-def equal_bins(image):
+def equal_bins(image,row=0):
     if type(image) == type(Image.new('RGB',(1,1))):
         image = np.array(image)
     return (image // 64 * 85).astype(np.uint8)
 
-def nearest_color(image):
+def nearest_color(image,row=0):
     if type(image) == type(Image.new('RGB',(1,1))):
         image = np.array(image)
     return 85 * np.round(image/85).astype(np.uint8)
 
+class ErrorDiffusion:
+    """
+    Error diffusion dithering to the four printer grays. kernel lists
+    (down, right, weight) for where each pixel's error goes, and lag is how
+    many columns a row must stay behind the row above.
+
+    Instead of visiting pixels one at a time, pixels on the same slanted
+    line x + lag*y are handled together: none of them feeds error into
+    another, and every pixel feeding into them lies on an earlier line.
+    Error that runs off the bottom is handed back so a following band can
+    pick it up.
+    """
+
+    #rows per band in to_twobit, a multiple of 16 tall enough that the
+    #wavefronts stay long
+    BAND_ROWS = 512
+
+    def __init__(self,kernel,divisor,lag):
+        self.kernel = [(dy,dx,weight/divisor) for dy,dx,weight in kernel]
+        self.lag = lag
+
+    @staticmethod
+    @functools.lru_cache(maxsize=16)
+    def _wavefronts(h,w,lag):
+        #flat indices, into a (h+2, w+4) buffer, of each slanted line
+        ys,xs = np.mgrid[0:h,0:w]
+        order = np.argsort((xs + lag*ys).ravel(),kind='stable')
+        flat = (ys*(w+4) + xs + 2).ravel()[order]
+        counts = np.bincount((xs + lag*ys).ravel())
+        return np.split(flat,np.cumsum(counts)[:-1])
+
+    def twobit(self,image,row=0,carry=None):
+        """
+        Dithers image and returns (twobit array, error carried into the
+        next two rows)
+        """
+        image = np.asarray(image)
+        h,w = image.shape
+        buf = np.zeros((h+2,w+4))
+        buf[:h,2:w+2] = image
+        if carry is not None:
+            buf[:2,2:w+2] += carry
+        flat = buf.ravel()
+        out = np.empty((h+2,w+4),dtype=np.uint8)
+        out_flat = out.ravel()
+        offsets = [(dy*(w+4) + dx,weight) for dy,dx,weight in self.kernel]
+
+        for idx in self._wavefronts(h,w,self.lag):
+            old = flat[idx]
+            q = np.clip(np.round(old/85),0,3)
+            out_flat[idx] = q
+            err = old - 85*q
+            for offset,weight in offsets:
+                flat[idx+offset] += err*weight
+
+        twobit = out[:h,2:w+2]
+        twobit ^= 3
+        return twobit,buf[h:,2:w+2].copy()
+
+    def to_twobit(self,image,row=0):
+        """
+        Dithers a whole image BAND_ROWS rows at a time, carrying the error
+        from band to band, so the cached wavefronts stay small whatever the
+        image height
+        """
+        image = np.asarray(image)
+        dither_band = self.stream()
+        return np.concatenate([dither_band(image[top:top+self.BAND_ROWS],row+top)
+                               for top in range(0,max(len(image),1),self.BAND_ROWS)])
+
+    def __call__(self,image,row=0):
+        return (3 - self.to_twobit(image,row))*85
+
+    def stream(self):
+        """
+        A dither function for consecutive bands of one image, carrying the
+        error from each band into the next
+        """
+        state = {'carry':None}
+        def dither_band(image,row=0):
+            twobit,state['carry'] = self.twobit(image,row,state['carry'])
+            return twobit
+        return dither_band
+
+floyd_steinberg = ErrorDiffusion([(0,1,7),(1,-1,3),(1,0,5),(1,1,1)],16,lag=2)
+
+atkinson = ErrorDiffusion([(0,1,1),(0,2,1),(1,-1,1),(1,0,1),(1,1,1),(2,0,1)],8,lag=2)
+
+jarvis_judice_ninke = ErrorDiffusion([(0,1,7),(0,2,5),
+                                      (1,-2,3),(1,-1,5),(1,0,7),(1,1,5),(1,2,3),
+                                      (2,-2,1),(2,-1,3),(2,0,5),(2,1,3),(2,2,1)],48,lag=3)
+
 class DitherFactory:
     def __init__(self):
         self._modes = {}
-
-    def register(self, key, func):
+        self._twobit_modes = {}
+        self._stream_factories = {}
+
+    def register(self, key, func, twobit_func=None, stream_factory=None):
+        """
+        twobit_func, if given, does the same dithering but returns a twobit
+        array directly, saving the gray_to_twobit pass. stream_factory, for
+        modes that carry state from one band to the next, makes a fresh
+        twobit function for dithering an image band by band.
+        """
         self._modes[key] = func
+        if twobit_func:
+            self._twobit_modes[key] = twobit_func
+        if stream_factory:
+            self._stream_factories[key] = stream_factory
 
     def select(self, key, **kwargs):
         mode = self._modes.get(key)
@@ -110,19 +286,35 @@ class DitherFactory:
             raise ValueError(key)
         return mode
 
+    def select_twobit(self, key):
+        if key in self._twobit_modes:
+            return self._twobit_modes[key]
+        mode = self.select(key)
+        return lambda image,row=0: gray_to_twobit(mode(image,row=row))
+
+    def stream(self, key):
+        if key in self._stream_factories:
+            return self._stream_factories[key]()
+        return self.select_twobit(key)
+
     @property
     def modes(self):
         return self._modes.keys()
 
 dither_factory = DitherFactory()
-dither_factory.register('bayer',bayer)
+dither_factory.register('bayer',bayer,bayer_twobit)
 dither_factory.register('equalbins',equal_bins)
 dither_factory.register('nearest',nearest_color)
+for key,diffusion in [('floydsteinberg',floyd_steinberg),
+                      ('atkinson',atkinson),
+                      ('jjn',jarvis_judice_ninke)]:
+    dither_factory.register(key,diffusion,diffusion.to_twobit,diffusion.stream)
 
-def dither(image,mode='bayer'):
+def dither(image,mode='bayer',row=0):
     """
     Dither the image with the selected algorithm and return a 
-    numpy array of grayscale values (0/85/170/255)
+    numpy array of grayscale values (0/85/170/255). row is the image's
+    starting row when dithering a band of a larger picture.
     """
 
     im_arr = np.array(image)
@@ -130,7 +322,16 @@ def dither(image,mode='bayer'):
     if mode not in dither_factory.modes:
         raise ValueError('Invalid dithering method')
     dither_func = dither_factory.select(mode)
-    return dither_func(image)
+    return dither_func(image,row=row)
+
+def dither_twobit(image,mode='bayer',row=0):
+    """
+    Same as gray_to_twobit(dither(image,mode,row)), skipping the grayscale
+    step for modes that can
+    """
+    if mode not in dither_factory.modes:
+        raise ValueError('Invalid dithering method')
+    return dither_factory.select_twobit(mode)(image,row=row)
 
 def gray_to_twobit(arr):
     """
@@ -146,18 +347,110 @@ def twobit_to_gbtile(arr):
     GB Printer, you'll have to chop it into 640-byte sections on your own.
     """
 
-    gbtile = b''
-    rows = arr.shape[0]
-    for strip in np.vsplit(arr,rows//8):
-        for tile in np.hsplit(strip,20):
-            tile_hex = b''
-            for row in tile:
-                low = bytes([sum([(x%2)*(2**(7-i)) for i,x in enumerate(row)])])
-                high = bytes([sum([(x//2)*(2**(7-i)) for i,x in enumerate(row)])])
-                tile_hex = tile_hex + low + high
-            gbtile = gbtile + tile_hex
+    arr = np.asarray(arr,dtype=np.uint8)
+    rows,cols = arr.shape
+    strips,tiles = rows//8, cols//8
+
+    #(strips, rows, tiles, 8) -> (strips, tiles, rows, 8)
+    blocks = arr.reshape(strips,8,tiles,8).transpose(0,2,1,3)
+
+    #each tile row is a low-plane byte followed by a high-plane byte
+    gbtile = np.empty((strips,tiles,8,2),dtype=np.uint8)
+    gbtile[...,0] = np.packbits(blocks & 1,axis=-1)[...,0]
+    gbtile[...,1] = np.packbits(blocks >> 1,axis=-1)[...,0]
 
-    return gbtile
+    return gbtile.tobytes()
+
+def rle_compress(data):
+    """
+    Compresses one packet's worth of gbtile bytes with the printer's RLE
+    scheme: a command byte 0x80+n is a run of n+2 copies of the next byte,
+    0x00+n is n+1 literal bytes. Picks the split into runs and literal
+    blocks that gives the shortest output.
+    """
+    data = bytes(data)
+    n = len(data)
+    if n == 0:
+        return b''
+
+    #cost[i] is the shortest encoding of data[:i]. It never decreases with
+    #i, so a run ending at i is cheapest taken as long as it can be, and a
+    #literal block ending at i starts wherever cost[j] - j is smallest,
+    #which a sliding window minimum finds
+    cost = [0]*(n+1)
+    back = [0]*(n+1)
+    window = deque()
+    run = 0
+    for i in range(1,n+1):
+        run = run + 1 if i > 1 and data[i-1] == data[i-2] else 1
+
+        j = i - 1
+        while window and cost[window[-1]] - window[-1] >= cost[j] - j:
+            window.pop()
+        window.append(j)
+        if window[0] < i - 128:
+            window.popleft()
+        j = window[0]
+        cost[i] = cost[j] - j + i + 1
+        back[i] = j
+
+        if run >= 2:
+            j = i - min(run,129)
+            if cost[j] + 2 <= cost[i]:
+                cost[i] = cost[j] + 2
+                back[i] = -1 - j #negative marks a run
+
+    blocks = []
+    i = n
+    while i > 0:
+        j = back[i]
+        blocks.append((j,i))
+        i = j if j >= 0 else -1 - j
+    out = bytearray()
+    for j,i in reversed(blocks):
+        if j < 0:
+            out += bytes([0x80 + i - (-1 - j) - 2,data[i-1]])
+        else:
+            out.append(i - j - 1)
+            out += data[j:i]
+    return bytes(out)
+
+def rle_decompress(comp_data,size=640):
+    """
+    Undoes rle_compress, returning bytes. Raises ValueError if the data is
+    truncated or decodes to more than size bytes, or, unless size is None,
+    to fewer.
+    """
+    if not isinstance(comp_data,(bytes,bytearray,memoryview)):
+        comp_data = bytes(comp_data)
+    comp = memoryview(comp_data)
+    len_comp = len(comp)
+
+    out = bytearray(size if size != None else 0)
+    comp_offset = 0
+    raw_offset = 0
+    while comp_offset < len_comp:
+        command_byte = comp[comp_offset]
+        if command_byte & 0x80: #compressed run
+            length = command_byte - 0x80 + 2
+            next_offset = comp_offset + 2
+        else: #uncompressed run
+            length = command_byte + 1
+            next_offset = comp_offset + 1 + length
+        if next_offset > len_comp:
+            raise ValueError('Compressed data ends in the middle of a run')
+        if size != None and raw_offset + length > size:
+            raise ValueError('Compressed data decodes to more than {} bytes'.format(size))
+        if command_byte & 0x80:
+            out[raw_offset:raw_offset+length] = comp[comp_offset+1:next_offset].tobytes() * length
+        else:
+            out[raw_offset:raw_offset+length] = comp[comp_offset+1:next_offset]
+        comp_offset = next_offset
+        raw_offset += length
+
+    if size != None and raw_offset != size:
+        raise ValueError('Compressed data decodes to {} bytes, expected {}'.format(raw_offset,size))
+    return bytes(out)
 
 #black, darkgray, lightgray, white
 PALETTES = {
@@ -171,7 +464,7 @@ PALETTES = {
     'gbpurple': ('000000','52528C','8C8CDE','FFFFFF'),
     'gbbrown': ('5A3108','846B29','CE9C84','FFE6C5'),
     'gbrby': ('000000','9494FF','FF9494','FFFFA5'),
-    'gbredyellow': ('000000','FF0000','FFF00','FFFFFF'),
+    'gbredyellow': ('000000','FF0000','FFFF00','FFFFFF'),
     'gbgreenorange': ('000000','FF4200','52FF00','FFFFFF'),
     'gbinverse': ('FFFFFF','FFDE00','008484','000000'),
     'gbreinverse': ('000000','008484','FFDE00','FFFFFF'),
@@ -185,18 +478,66 @@ def palette_convert(palette_tuple):
     palette_list = [int(color,16) for color in palette_pairs]
     return palette_list
 
-def twobit_to_image(arr,palette='gray',save=False):
+@functools.lru_cache(maxsize=None)
+def palette_lut(palette='gray'):
     """
-    Convert an image matrix back into a PIL image object
+    (4, 4) RGBA lookup indexed directly by twobit value, so 0 is the
+    palette's lightest color. palette is a PALETTES name or a tuple of four
+    hex colors, darkest first.
     """
+    if type(palette) != tuple:
+        palette = PALETTES[palette]
+    rgb = np.array(palette_convert(palette),dtype=np.uint8).reshape(4,3)[::-1]
+    lut = np.full((4,4),255,dtype=np.uint8)
+    lut[:,:3] = rgb
+    lut.setflags(write=False)
+    return lut
+
+def scale_index(arr,scale):
+    """
+    arr blown up scale times with nearest neighbour, as one copy
+    """
+    if scale == 1:
+        return arr
+    h,w = arr.shape
+    return np.broadcast_to(arr[:,None,:,None],(h,scale,w,scale)).reshape(h*scale,w*scale)
 
-    arr_flip = 3 - arr
+def twobit_to_rgb(arr,palette='gray',scale=1,alpha=False,raw=False):
+    """
+    Render a twobit array as an RGB (or RGBA) numpy array with one lookup,
+    optionally scaled up by a whole number. raw=True returns a memoryview
+    of the pixels instead, for handing to PIL or anything else that takes
+    a buffer without copying it.
+    """
+    lut = palette_lut(palette)
+    if not alpha:
+        lut = lut[:,:3]
+    rgb = lut[scale_index(np.asarray(arr),scale)]
+    return memoryview(rgb) if raw else rgb
 
-    image = Image.fromarray(arr_flip,'P')
-    if type(palette) == tuple:
-        image.putpalette(palette_convert(palette))
+def twobit_to_image(arr,palette='gray',save=False,mode='P',scale=1,raw=False):
+    """
+    Convert an image matrix back into a PIL image object, either paletted
+    (mode='P') or in 'RGB' or 'RGBA'. The image gets its own copy of the
+    pixels unless raw=True, where a 'P' image at scale 1 wraps arr itself
+    when it can, and changes along with it.
+    """
+
+    arr = np.asarray(arr,dtype=np.uint8)
+    if scale != 1:
+        arr = scale_index(arr,scale)
+    elif not raw:
+        arr = arr.copy()
+    arr = np.ascontiguousarray(arr)
+    h,w = arr.shape
+    if mode == 'P':
+        image = Image.frombuffer('P',(w,h),arr,'raw','P',0,1)
+        image.putpalette(palette_lut(palette)[:,:3].tobytes())
+    elif mode in ['RGB','RGBA']:
+        rgb = twobit_to_rgb(arr,palette,alpha=(mode == 'RGBA'))
+        image = Image.frombuffer(mode,(w,h),rgb,'raw',mode,0,1)
     else:
-        image.putpalette(palette_convert(PALETTES[palette]))
+        raise ValueError('mode must be P, RGB, or RGBA')
         
     if save:
         image.save(time.strftime('gbp_out/gbp_%Y%m%d_%H%M%S.png'),'PNG')
@@ -207,25 +548,16 @@ def gbtile_to_twobit(gbtile_bytes):
     converts bytes in GB tile format to 2-bit matrix
     """
 
-    #only needed for dealing with compressed data that's not uncompressed
-    #testing only, probably no longer needed
-    #padding = bytes(640-(len(gbtile_bytes)%640))
-    #gbtile_bytes = gbtile_bytes + bytes(padding)
-
     num_pages = len(gbtile_bytes)//640
-    twobit = np.empty((16*num_pages,160))
+    data = np.frombuffer(gbtile_bytes,dtype=np.uint8,count=640*num_pages)
 
-    for s in range(num_pages*2):
-        strip_bytes = gbtile_bytes[320*s:320*(s+1)]
-        for t in range(20):
-            tile_bytes = strip_bytes[16*t:16*(t+1)]
-            for r in range(8):
-                row_bytes = tile_bytes[2*r:2*(r+1)]
-                low, high = row_bytes
-                mat_row = [(low>>i & 1) + 2*(high>>i & 1) for i in reversed(range(8))]
-                twobit[s*8+r,t*8:(t+1)*8] = mat_row
+    #(strips, tiles, rows, low/high) -> unpack to (strips, tiles, rows, low/high, 8)
+    bits = np.unpackbits(data.reshape(2*num_pages,20,8,2,1),axis=-1)
+    twobit = bits[:,:,:,1,:] << 1
+    twobit |= bits[:,:,:,0,:]
 
-    return twobit.astype(np.uint8)
+    #(strips, tiles, rows, 8) -> (strips, rows, tiles, 8)
+    return twobit.transpose(0,2,1,3).reshape(16*num_pages,160)
 
 
 
@@ -234,9 +566,34 @@ def image_to_gbtile(image,dither_mode='bayer',rotate='auto',align='center'):
     Does the full conversion, image file/object goes in, gbtile bytestring 
     comes out. This is what you want to use tor everyday processing
     """
-    image = gray_resize(image,rotate=rotate,align=align)
-    im_dith = dither(image,dither_mode)
-    twobit = gray_to_twobit(im_dith)
-    gb_tiles = twobit_to_gbtile(twobit)
+    with metrics.timer('resize'):
+        image = gray_resize(image,rotate=rotate,align=align)
+    with metrics.timer('dither'):
+        twobit = dither_twobit(image,dither_mode)
+    with metrics.timer('tile_encode'):
+        gb_tiles = twobit_to_gbtile(twobit)
 
     return gb_tiles
+
+def iter_gbtile_pages(image,dither_mode='bayer',rotate='auto',align='center'):
+    """
+    Streaming version of image_to_gbtile: yields 640-byte pages, dithering
+    and encoding one 16-row band at a time, so only the 160-px-wide resized
+    image is ever held whole. Gives the same bytes as image_to_gbtile.
+    """
+    if dither_mode not in dither_factory.modes:
+        raise ValueError('Invalid dithering method')
+    dither_band = dither_factory.stream(dither_mode)
+    bands = iter_gray_bands(image,rotate=rotate,align=align)
+    row = 0
+    while True:
+        with metrics.timer('resize'):
+            band = next(bands,None)
+        if band is None:
+            return
+        with metrics.timer('dither'):
+            twobit = dither_band(band,row=row)
+        with metrics.timer('tile_encode'):
+            page = twobit_to_gbtile(twobit)
+        row += 16
+        yield page
@@ -0,0 +1,121 @@
+"""
+Opt-in timers and counters for the print pipeline. Nothing is recorded
+until enable() is called; until then timer() hands back a shared do-nothing
+context manager and count() returns straight away.
+
+    from gbprinter import metrics
+    m = metrics.enable()
+    PrintJob.from_image(printer,'cat.png').run()
+    print(m.summary())
+
+Stages timed: resize, dither, tile_encode, send (per command), status_poll
+and print_wait in the controller and print job, handle_packet in the
+emulator. Counters: controller_commands and emulator_packets, by type.
+"""
+from collections import defaultdict
+from contextlib import nullcontext
+from time import perf_counter
+import threading
+
+active = None
+
+_null_timer = nullcontext()
+
+class Timer:
+    __slots__ = ['metrics','key','start']
+
+    def __init__(self,metrics,key):
+        self.metrics = metrics
+        self.key = key
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self,*exc):
+        self.metrics.add_time(self.key,perf_counter() - self.start)
+        return False
+
+def _key(name,labels):
+    return (name,tuple(sorted(labels.items())))
+
+def _label_text(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k,v) for k,v in labels) + '}'
+
+class Metrics:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.timers = defaultdict(lambda: [0,0.0]) #key: [calls, seconds]
+            self.counters = defaultdict(int)
+
+    def time(self,name,**labels):
+        return Timer(self,_key(name,labels))
+
+    def add_time(self,key,seconds):
+        with self._lock:
+            timer = self.timers[key]
+            timer[0] += 1
+            timer[1] += seconds
+
+    def count(self,name,n=1,**labels):
+        key = _key(name,labels)
+        with self._lock:
+            self.counters[key] += n
+
+    def summary(self):
+        lines = ['{:<40} {:>8} {:>10} {:>10}'.format('stage','calls','total (s)','mean (ms)')]
+        for (name,labels),(calls,seconds) in sorted(self.timers.items()):
+            lines.append('{:<40} {:>8} {:>10.4f} {:>10.3f}'.format(
+                         name + _label_text(labels),calls,seconds,1000*seconds/calls))
+        lines.append('{:<40} {:>8}'.format('counter','count'))
+        for (name,labels),n in sorted(self.counters.items()):
+            lines.append('{:<40} {:>8}'.format(name + _label_text(labels),n))
+        return '\n'.join(lines)
+
+    def prometheus(self,prefix='gbprinter'):
+        """
+        Everything in the Prometheus text exposition format
+        """
+        lines = []
+        timers = sorted(self.timers.items())
+        for metric,index,fmt in [('stage_seconds_total',1,'{:.6f}'),('stage_calls_total',0,'{}')]:
+            if timers:
+                lines.append('# TYPE {}_{} counter'.format(prefix,metric))
+            for (name,labels),values in timers:
+                labels = _label_text((('stage',name),) + labels)
+                lines.append('{}_{}{} '.format(prefix,metric,labels) + fmt.format(values[index]))
+        names = sorted(set(name for name,labels in self.counters))
+        for name in names:
+            lines.append('# TYPE {}_{}_total counter'.format(prefix,name))
+            for (n,labels),count in sorted(self.counters.items()):
+                if n == name:
+                    lines.append('{}_{}_total{} {}'.format(prefix,name,_label_text(labels),count))
+        return '\n'.join(lines) + '\n'
+
+def enable(metrics=None):
+    """
+    Starts recording into metrics (a new Metrics by default) and returns it
+    """
+    global active
+    active = metrics if metrics != None else Metrics()
+    return active
+
+def disable():
+    global active
+    active = None
+
+def timer(name,**labels):
+    if active == None:
+        return _null_timer
+    return active.time(name,**labels)
+
+def count(name,n=1,**labels):
+    if active != None:
+        active.count(name,n,**labels)
@@ -0,0 +1,177 @@
+from .printjob import PAGE_SIZE, BUFFER_PAGES, PrinterError, send_batch, wait_until_idle
+from time import monotonic
+import threading
+import queue
+import logging
+
+class PoolJob:
+    """
+    One image's worth of pages submitted to a PrinterPool. Its 9-page
+    batches may be printed by different printers.
+    """
+
+    def __init__(self,name,num_batches):
+        self.name = name
+        self.num_batches = num_batches
+        self.batches_done = 0
+        self.failed = False
+        self.error = None
+
+    @property
+    def done(self):
+        return self.batches_done == self.num_batches
+
+class Batch:
+    def __init__(self,job,index,pages,last):
+        self.job = job
+        self.index = index
+        self.pages = pages
+        self.last = last
+        self.attempts = 0
+
+class PrinterPool:
+    """
+    Prints a queue of jobs on several Controllers at once. Each printer has
+    a worker thread that takes the next 9-page batch as soon as its printer
+    is idle. A batch that fails to send never printed, so it is put back for
+    any printer to retry. A printer that reports a paper jam, low battery or
+    other hardware error is taken out of the pool.
+
+    A printer that fails while printing a batch is taken out of the pool
+    too. Part of that batch may be on paper already, so it only goes back
+    in the queue with reprint=True; otherwise its job is marked failed.
+    """
+
+    def __init__(self,printers,poll_interval=.05,max_attempts=3,top_margin=0x0,bottom_margin=0x4,
+                 reprint=False):
+        self.logger = logging.getLogger(__name__)
+        self.printers = list(printers)
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self.top_margin = top_margin
+        self.bottom_margin = bottom_margin
+        self.reprint = reprint
+        self.jobs = []
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._outstanding = 0
+        self.pages_printed = 0
+        self.pages_by_printer = [0]*len(self.printers)
+        self.offline = set()
+        self.elapsed = 0
+
+    def submit(self,pages,name=None):
+        """
+        Queues a job. pages is a gbtile bytestring or an iterable of 640-byte
+        pages, e.g. from image.iter_gbtile_pages.
+        """
+        if isinstance(pages,(bytes,bytearray)):
+            pages = [pages[i:i+PAGE_SIZE] for i in range(0,len(pages),PAGE_SIZE)]
+        pages = list(pages)
+        batches = [pages[i:i+BUFFER_PAGES] for i in range(0,len(pages),BUFFER_PAGES)]
+        job = PoolJob(name if name != None else 'job {}'.format(len(self.jobs)+1),len(batches))
+        self.jobs.append(job)
+        with self._lock:
+            self._outstanding += len(batches)
+        for i,batch in enumerate(batches):
+            self._queue.put(Batch(job,i,batch,i == len(batches)-1))
+        return job
+
+    def _send_batch(self,n,batch):
+        bottom_margin = self.bottom_margin if batch.last else 0x0
+        send_batch(self.printers[n],batch.pages,self.top_margin,bottom_margin,self.logger)
+
+    def _retry(self,batch,error):
+        """
+        Puts a batch back in the queue, or fails its job if it has run out of
+        attempts
+        """
+        if batch.attempts < self.max_attempts:
+            self._queue.put(batch)
+        else:
+            with self._lock:
+                batch.job.failed = True
+                batch.job.error = error
+                self._outstanding -= 1
+
+    def _worker(self,n):
+        #keep waiting while batches are in flight elsewhere, they may come
+        #back if another printer fails
+        while True:
+            with self._lock:
+                if self._outstanding == 0:
+                    return
+            try:
+                batch = self._queue.get(timeout=self.poll_interval)
+            except queue.Empty:
+                continue
+
+            batch.attempts += 1
+            self.logger.info('printer {} taking {} batch {}'.format(n,batch.job.name,batch.index+1))
+            try:
+                self._send_batch(n,batch)
+            except IOError as e:
+                fatal = not isinstance(e,PrinterError) or e.fatal
+                self.logger.warning('printer {} failed {} batch {}: {}'.format(n,batch.job.name,batch.index+1,e))
+                self._retry(batch,e)
+                if fatal:
+                    with self._lock:
+                        self.offline.add(n)
+                    return
+                continue
+
+            try:
+                wait_until_idle(self.printers[n],self.poll_interval)
+            except IOError as e:
+                self.logger.warning('printer {} failed while printing {} batch {}: {}'.format(n,batch.job.name,batch.index+1,e))
+                if self.reprint:
+                    self._retry(batch,e)
+                else:
+                    with self._lock:
+                        batch.job.failed = True
+                        batch.job.error = e
+                        self._outstanding -= 1
+                with self._lock:
+                    self.offline.add(n)
+                return
+
+            with self._lock:
+                self._outstanding -= 1
+                batch.job.batches_done += 1
+                self.pages_printed += len(batch.pages)
+                self.pages_by_printer[n] += len(batch.pages)
+
+    def run(self):
+        """
+        Prints everything queued so far and returns the list of jobs. Jobs
+        whose batches ran out of attempts, or were left over when every
+        printer went offline, are marked failed.
+        """
+        start = monotonic()
+        workers = [threading.Thread(target=self._worker,args=(n,),daemon=True)
+                   for n in range(len(self.printers)) if n not in self.offline]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.elapsed += monotonic() - start
+
+        while not self._queue.empty():
+            batch = self._queue.get_nowait()
+            batch.job.failed = True
+            batch.job.error = batch.job.error or IOError('No printers left')
+            self._outstanding -= 1
+        return self.jobs
+
+    @property
+    def pages_per_minute(self):
+        return 60 * self.pages_printed / self.elapsed if self.elapsed else 0
+
+    def report(self):
+        lines = ['{} pages in {:.1f} s, {:.1f} pages/min'.format(self.pages_printed,self.elapsed,self.pages_per_minute)]
+        for n,pages in enumerate(self.pages_by_printer):
+            lines.append('  printer {}: {} pages{}'.format(n,pages,' (offline)' if n in self.offline else ''))
+        for job in self.jobs:
+            state = 'failed: {}'.format(job.error) if job.failed else 'done' if job.done else 'incomplete'
+            lines.append('  {}: {}/{} batches, {}'.format(job.name,job.batches_done,job.num_batches,state))
+        return '\n'.join(lines)
@@ -0,0 +1,135 @@
+"""
+Finding the serial port an Arduino is on. Candidates are probed in parallel,
+each with a handshake that retries until a short deadline instead of
+sleeping through the Arduino's boot, and the port that worked last time is
+remembered on disk and tried first.
+"""
+import serial
+import serial.tools.list_ports
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from time import monotonic
+import threading
+import platform
+import logging
+import glob
+import json
+import os
+
+logger = logging.getLogger(__name__)
+
+#USB vendor/product IDs of boards and USB-serial chips an Arduino shows up as
+USB_IDS = [
+    (0x2341,None), #Arduino
+    (0x2A03,None), #Arduino (arduino.org)
+    (0x1A86,0x7523), #CH340
+    (0x0403,0x6001), #FTDI FT232R
+    (0x10C4,0xEA60), #CP210x
+]
+
+HANDSHAKE_TIMEOUT = 3
+
+def cache_path():
+    cache_dir = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(cache_dir,'gbprinter','ports.json')
+
+def load_cache():
+    try:
+        with open(cache_path()) as f:
+            return json.load(f)
+    except (OSError,ValueError):
+        return {}
+
+def save_cache(kind,port):
+    cache = load_cache()
+    cache[kind] = {'port':port, 'id':port_identity(port)}
+    try:
+        os.makedirs(os.path.dirname(cache_path()),exist_ok=True)
+        with open(cache_path(),'w') as f:
+            json.dump(cache,f)
+    except OSError:
+        logger.debug('could not write port cache')
+
+def port_identity(port):
+    """
+    [vid, pid, serial number] of a USB port, or None if it isn't one
+    """
+    for info in serial.tools.list_ports.comports():
+        if info.device == port and info.vid != None:
+            return [info.vid,info.pid,info.serial_number]
+    return None
+
+def usb_matches(vid,pid,usb_ids=USB_IDS):
+    return any(vid == v and (p == None or pid == p) for v,p in usb_ids)
+
+def candidate_ports(usb_ids=USB_IDS):
+    """
+    Ports whose USB IDs look like an Arduino. If none do, or the system
+    can't tell, every serial-looking device node is a candidate.
+    """
+    matched = [info.device for info in serial.tools.list_ports.comports()
+               if info.vid != None and usb_matches(info.vid,info.pid,usb_ids)]
+    if matched:
+        return matched
+
+    opsys = platform.system()
+    if opsys == 'Windows':
+        return ['COM%s' % (i + 1) for i in range(256)]
+    elif opsys == 'Linux':
+        return glob.glob('/dev/tty[A-Za-z]*')
+    elif opsys == 'Darwin':
+        return glob.glob('/dev/tty.*')
+    else:
+        raise EnvironmentError('Not Windows, Mac, or Linux, dunno where your serial ports would be')
+
+def probe(port,handshake,timeout=HANDSHAKE_TIMEOUT,cancelled=None):
+    """
+    Opens port and retries handshake(serial) until it returns True or
+    timeout seconds pass. Returns the open port, or None.
+    """
+    try:
+        s = serial.Serial(port,baudrate=115200,timeout=.05)
+    except (OSError,serial.SerialException):
+        return None
+    deadline = monotonic() + timeout
+    try:
+        while monotonic() < deadline and not (cancelled and cancelled.is_set()):
+            if handshake(s):
+                s.timeout = .2
+                return s
+            s.reset_input_buffer()
+    except (OSError,serial.SerialException):
+        pass
+    s.close()
+    return None
+
+def find_port(kind,handshake,timeout=HANDSHAKE_TIMEOUT,usb_ids=USB_IDS,workers=16):
+    """
+    Returns (open serial port, port name) for the first port where
+    handshake succeeds. kind names the device in the cache.
+    """
+    cached = load_cache().get(kind)
+    if cached and port_identity(cached['port']) == cached['id']:
+        logger.info('trying last good port ' + cached['port'])
+        s = probe(cached['port'],handshake,timeout)
+        if s != None:
+            return s,cached['port']
+
+    ports = candidate_ports(usb_ids)
+    logger.info('checking ports ' + ','.join(ports))
+
+    found = None
+    cancelled = threading.Event()
+    with ThreadPoolExecutor(max_workers=max(1,min(workers,len(ports)))) as pool:
+        futures = {pool.submit(probe,port,handshake,timeout,cancelled):port for port in ports}
+        for future in as_completed(futures):
+            s = future.result()
+            if s != None and found == None:
+                found = (s,futures[future])
+                cancelled.set()
+            elif s != None:
+                s.close()
+
+    if found == None:
+        return None,None
+    save_cache(kind,found[1])
+    return found
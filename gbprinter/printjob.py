@@ -0,0 +1,185 @@
+from . import image
+from . import metrics
+from time import sleep, monotonic
+import threading
+import queue
+import logging
+
+#status bits, see Controller.statuses
+CHECKSUM_ERROR = 0
+PRINTER_BUSY = 1
+UNPROCESSED_DATA = 3
+PACKET_ERROR = 4
+PAPER_JAM = 5
+OTHER_ERROR = 6
+LOW_BATTERY = 7
+
+BUSY_MASK = (1 << PRINTER_BUSY) | (1 << UNPROCESSED_DATA)
+ERROR_MASK = (1 << CHECKSUM_ERROR) | (1 << PACKET_ERROR) | (1 << PAPER_JAM) | (1 << OTHER_ERROR) | (1 << LOW_BATTERY)
+#errors that won't clear up by sending the batch again
+FATAL_MASK = (1 << PAPER_JAM) | (1 << OTHER_ERROR) | (1 << LOW_BATTERY)
+
+PAGE_SIZE = 640
+BUFFER_PAGES = 9
+
+class PrinterError(IOError):
+    """
+    The printer reported an error bit, status is the [keepalive, status]
+    response it came with
+    """
+    def __init__(self,status,problems):
+        IOError.__init__(self,'Printer reported ' + ', '.join(problems))
+        self.status = status
+
+    @property
+    def fatal(self):
+        return bool(self.status[1] & FATAL_MASK)
+
+def check_status(printer,status):
+    """
+    Raises PrinterError if a [keepalive, status] response has an error bit
+    set, otherwise returns it
+    """
+    if status[1] & ERROR_MASK:
+        raise PrinterError(status,printer.translate_status(status))
+    return status
+
+def send_batch(printer,batch,top_margin=0x0,bottom_margin=0x0,logger=None):
+    """
+    Fills the printer's buffer with up to 9 pages and starts printing them.
+    Every reply up to the print command is checked, so a PrinterError from
+    here means nothing of the batch was printed.
+    """
+    logger = logger or logging.getLogger(__name__)
+    check_status(printer,printer.cmd_init())
+    check_status(printer,printer.cmd_status())
+
+    for i,page in enumerate(batch):
+        logger.info('sending data %s/%s',i+1,len(batch))
+        check_status(printer,printer.cmd_data(page))
+        check_status(printer,printer.cmd_status())
+
+    check_status(printer,printer.cmd_data())
+    check_status(printer,printer.cmd_status())
+
+    logger.info('sending print command')
+    printer.cmd_print(top_margin,bottom_margin)
+    printer.cmd_status()
+
+def wait_until_idle(printer,poll_interval=.05):
+    """
+    Polls status until the printer stops being busy, raising PrinterError
+    if it reports a problem instead
+    """
+    while True:
+        with metrics.timer('status_poll'):
+            status = check_status(printer,printer.cmd_status())
+        if not status[1] & BUSY_MASK:
+            return status
+        sleep(poll_interval)
+
+class PrintJob:
+    """
+    Prints a stream of 640-byte pages in three overlapping stages: a producer
+    thread that converts pages, a sender that fills the printer's 9-page
+    buffer as soon as enough pages are ready, and a status poller that moves
+    on to the next batch as soon as the printer stops being busy.
+    """
+
+    def __init__(self,printer,pages,poll_interval=.05,prefetch=2*BUFFER_PAGES,
+                 top_margin=0x0,bottom_margin=0x4):
+        self.logger = logging.getLogger(__name__)
+        self.printer = printer
+        self.pages = pages
+        self.poll_interval = poll_interval
+        self.top_margin = top_margin
+        self.bottom_margin = bottom_margin
+        self._queue = queue.Queue(maxsize=prefetch)
+        self._done = object()
+        self._stop = threading.Event()
+        self.pages_sent = 0
+        self.first_print_time = None
+
+    @classmethod
+    def from_image(cls,printer,in_image,dither_mode='bayer',rotate='auto',align='center',**kwargs):
+        pages = image.iter_gbtile_pages(in_image,dither_mode,rotate,align)
+        return cls(printer,pages,**kwargs)
+
+    def _put(self,item):
+        """
+        Queues item for the sender, giving up and returning False if the job
+        stops first
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item,timeout=self.poll_interval or .05)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _produce(self):
+        try:
+            for page in self.pages:
+                if len(page) != PAGE_SIZE:
+                    raise ValueError('Pages must be {} bytes, got {}'.format(PAGE_SIZE,len(page)))
+                if not self._put(page):
+                    break
+            else:
+                self._put(self._done)
+        except Exception as e:
+            self._put(e)
+        finally:
+            #let a page generator release its source image now
+            close = getattr(self.pages,'close',None)
+            if close != None:
+                close()
+
+    def _next_page(self):
+        item = self._queue.get()
+        if isinstance(item,Exception):
+            raise item
+        return item
+
+    def batches(self):
+        """
+        Yields (pages, is_last) batches of up to 9 pages from the producer,
+        looking one page ahead so the last batch gets the bottom margin.
+        """
+        page = self._next_page()
+        while page is not self._done:
+            batch = []
+            while page is not self._done and len(batch) < BUFFER_PAGES:
+                batch.append(page)
+                page = self._next_page()
+            yield batch,page is self._done
+
+    def send_batch(self,batch,last):
+        bottom_margin = self.bottom_margin if last else 0x0
+        send_batch(self.printer,batch,self.top_margin,bottom_margin,self.logger)
+        self.pages_sent += len(batch)
+
+    def wait_until_idle(self):
+        with metrics.timer('print_wait'):
+            return wait_until_idle(self.printer,self.poll_interval)
+
+    def run(self):
+        """
+        Runs the whole job and returns the number of pages printed.
+        """
+        start = monotonic()
+        producer = threading.Thread(target=self._produce,daemon=True)
+        producer.start()
+
+        try:
+            for batch,last in self.batches():
+                self.send_batch(batch,last)
+                if self.first_print_time == None:
+                    self.first_print_time = monotonic() - start
+                    self.logger.info('first print started after {:.2f} s'.format(self.first_print_time))
+                self.wait_until_idle()
+        finally:
+            #on an error the producer may be waiting on a full queue
+            self._stop.set()
+            producer.join()
+        return self.pages_sent
@@ -0,0 +1,202 @@
+"""
+A Game Boy Printer and controller_arduino bridge in software. SimulatedPrinter
+is a serial-like object, so Controller, PrintJob and PrinterPool can run
+against it on any machine:
+
+    printer = Controller(SimulatedPrinter(), batched=True)
+
+It decodes each frame as it is clocked in, checks the checksum, keeps the
+9-page buffer, and answers with the keepalive and status bits a real
+printer would. Timing is optional. By default everything is instant. With
+byte_time, latency and page_time set, the time the link and the print
+head would take is added to a modelled clock (elapsed), or actually
+slept with realtime=True.
+"""
+from . import image
+from .emulator import Packet
+from .printjob import CHECKSUM_ERROR, PRINTER_BUSY, UNPROCESSED_DATA, PACKET_ERROR, FATAL_MASK, PAGE_SIZE, BUFFER_PAGES
+from time import sleep, monotonic
+import logging
+
+IMAGE_FULL = 2
+
+#roughly what the real hardware takes: controller_arduino clocks a byte
+#every ~1.2 ms, a USB round trip is ~1 ms, a 16-row page prints in ~0.65 s
+REALISTIC = {'byte_time':0.0012, 'latency':0.001, 'page_time':0.65}
+
+class SimulatedPrinter:
+
+    def __init__(self,byte_time=0,latency=0,page_time=0,realtime=False,timeout=.2):
+        self.logger = logging.getLogger(__name__)
+        self.byte_time = byte_time
+        self.latency = latency
+        self.page_time = page_time
+        self.realtime = realtime
+        self.timeout = timeout
+        self.elapsed = 0.0
+        self._start = monotonic()
+        self._out = bytearray()
+        self._frame = bytearray()
+        self._frame_len = 0
+        self._bulk_header = 0
+        self._bulk_left = 0
+        self._status = 0
+        self._buffer = bytearray()
+        self._print_done = None
+        self.printed = bytearray()
+        self.packets = 0
+        self.checksum_errors = 0
+
+    @classmethod
+    def realistic(cls,realtime=False):
+        return cls(realtime=realtime,**REALISTIC)
+
+    def now(self):
+        return monotonic() - self._start if self.realtime else self.elapsed
+
+    def _spend(self,seconds):
+        if self.realtime:
+            if seconds:
+                sleep(seconds)
+        else:
+            self.elapsed += seconds
+
+    @property
+    def status(self):
+        self._update()
+        return self._status
+
+    @property
+    def pages(self):
+        return len(self._buffer)//PAGE_SIZE
+
+    @property
+    def pages_printed(self):
+        return len(self.printed)//PAGE_SIZE
+
+    def set_error(self,bit,on=True):
+        """
+        Sets or clears a status bit by hand, e.g. PAPER_JAM, to test how
+        the host copes
+        """
+        if on:
+            self._status |= 1 << bit
+        else:
+            self._status &= ~(1 << bit)
+
+    #serial port interface
+
+    @property
+    def in_waiting(self):
+        return len(self._out)
+
+    def write(self,data):
+        start = len(self._out)
+        for byte in data:
+            if self._bulk_header:
+                self._bulk_left |= byte << (8*(2-self._bulk_header))
+                self._bulk_header -= 1
+                continue
+            if self._bulk_left:
+                self._bulk_left -= 1
+            elif not self._frame and byte == 0x42: #bulk marker, length follows
+                self._bulk_header = 2
+                continue
+            self._out.append(self._clock(byte))
+        self._spend((len(self._out) - start)*self.byte_time)
+        return len(data)
+
+    def read(self,size=1):
+        self._spend(self.latency)
+        data = bytes(self._out[:size])
+        del self._out[:size]
+        return data
+
+    def reset_input_buffer(self):
+        self._out.clear()
+
+    def close(self):
+        pass
+
+    #printer side
+
+    def _clock(self,byte):
+        """
+        Takes one byte from the Game Boy side and returns what the printer
+        shifts back at the same time
+        """
+        frame = self._frame
+        pos = len(frame)
+        if (pos == 0 and byte != 0x88) or (pos == 1 and byte != 0x33):
+            frame.clear()
+            return 0
+        frame.append(byte)
+        if pos == 5:
+            self._frame_len = 8 + (frame[4] | frame[5] << 8)
+        if pos < 6 or pos < self._frame_len:
+            return 0
+        if pos == self._frame_len:
+            self.handle_packet(Packet(bytes(frame[:pos]) + bytes(2)))
+            return 0x81
+        frame.clear()
+        return self.status
+
+    def _update(self):
+        if self._status & FATAL_MASK: #the print head stops until the fault is cleared
+            return
+        if self._print_done != None and self.now() >= self._print_done:
+            self.printed += self._buffer
+            self._buffer = bytearray()
+            self._print_done = None
+            self.set_error(PRINTER_BUSY,False)
+            self.set_error(IMAGE_FULL,False)
+
+    def handle_packet(self,packet):
+        self.packets += 1
+        self._update()
+        if not packet.verify_checksum():
+            self.checksum_errors += 1
+            self.set_error(CHECKSUM_ERROR)
+            return
+        self.set_error(CHECKSUM_ERROR,False)
+        busy = self._print_done != None
+        fault = self._status & FATAL_MASK #refuses data and prints, keeps reporting it
+
+        if packet.type == 1: #init
+            if not busy:
+                self._status &= FATAL_MASK #hardware faults stay until cleared by hand
+                self._buffer = bytearray()
+
+        elif packet.type == 2: #print
+            if not busy and not fault and self._buffer:
+                self.set_error(UNPROCESSED_DATA,False)
+                self.set_error(PRINTER_BUSY)
+                self._print_done = self.now() + self.pages*self.page_time
+
+        elif packet.type == 4: #data
+            if busy or fault:
+                pass
+            elif packet.data_size == 0:
+                self.set_error(IMAGE_FULL)
+            else:
+                try:
+                    data = image.rle_decompress(packet.data) if packet.header[1] else packet.data
+                except ValueError as e:
+                    self.logger.warning('Bad compressed packet: {}'.format(e))
+                    self.set_error(PACKET_ERROR)
+                    return
+                if self.pages >= BUFFER_PAGES:
+                    self.set_error(PACKET_ERROR)
+                else:
+                    self._buffer += data
+                    self.set_error(UNPROCESSED_DATA)
+
+        elif packet.type == 8: #break
+            self._buffer = bytearray()
+            self._print_done = None
+            self.set_error(PRINTER_BUSY,False)
+            self.set_error(IMAGE_FULL,False)
+            self.set_error(UNPROCESSED_DATA,False)
+
+        elif packet.type != 15: #anything but status
+            self.set_error(PACKET_ERROR)
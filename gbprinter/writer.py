@@ -0,0 +1,115 @@
+"""
+Writes finished prints to disk from a background thread, so encoding and
+saving a file never holds up the emulator's reply to the Game Boy.
+"""
+from . import image
+from time import monotonic
+import threading
+import logging
+import atexit
+import queue
+import time
+import os
+
+FORMATS = ['png','raw','gbtile']
+
+class ImageWriter:
+    """
+    Queue of twobit images to save, drained by one worker thread. format
+    is 'png', 'raw' (one twobit value per byte, 160 per row) or 'gbtile'.
+    The queue holds at most max_queue images, after that write() waits.
+    """
+
+    def __init__(self,directory='gbp_out',format='png',compress_level=6,max_queue=8):
+        if format not in FORMATS:
+            raise ValueError('format must be one of {}'.format(', '.join(FORMATS)))
+        self.logger = logging.getLogger(__name__)
+        self.directory = directory
+        self.format = format
+        self.compress_level = compress_level
+        self._queue = queue.Queue(max_queue)
+        self.written = 0
+        self.failed = 0
+        self.blocked = 0
+        self.max_depth = 0
+        self.write_seconds = 0
+        self.last_write_seconds = 0
+        self._thread = threading.Thread(target=self._worker,daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize()
+
+    @property
+    def stats(self):
+        return {'queue_depth':self.queue_depth, 'max_depth':self.max_depth,
+                'written':self.written, 'failed':self.failed, 'blocked':self.blocked,
+                'write_seconds':self.write_seconds, 'last_write_seconds':self.last_write_seconds}
+
+    def write(self,twobit,palette='gray'):
+        """
+        Queues a twobit array to be saved. The array must not change
+        afterwards. The filename is picked now, from the current time.
+        """
+        if not self._thread.is_alive():
+            raise ValueError('ImageWriter is closed')
+        name = time.strftime('gbp_%Y%m%d_%H%M%S')
+        try:
+            self._queue.put_nowait((name,twobit,palette))
+        except queue.Full:
+            self.blocked += 1
+            self.logger.warning('writer queue full, waiting')
+            self._queue.put((name,twobit,palette))
+        self.max_depth = max(self.max_depth,self._queue.qsize())
+
+    def filename(self,name):
+        path = os.path.join(self.directory,'{}.{}'.format(name,self.format))
+        n = 1
+        while os.path.exists(path):
+            n += 1
+            path = os.path.join(self.directory,'{}_{}.{}'.format(name,n,self.format))
+        return path
+
+    def save(self,name,twobit,palette):
+        os.makedirs(self.directory,exist_ok=True)
+        path = self.filename(name)
+        if self.format == 'png':
+            image.twobit_to_image(twobit,palette=palette).save(path,'PNG',compress_level=self.compress_level)
+        else:
+            data = twobit.tobytes() if self.format == 'raw' else image.twobit_to_gbtile(twobit)
+            with open(path,'wb') as f:
+                f.write(data)
+        return path
+
+    def _worker(self):
+        while True:
+            item = self._queue.get()
+            if item == None:
+                self._queue.task_done()
+                return
+            start = monotonic()
+            try:
+                path = self.save(*item)
+            except Exception as e:
+                self.failed += 1
+                self.logger.warning('could not save image: {}'.format(e))
+            else:
+                self.logger.info('saved {}'.format(path))
+                self.written += 1
+            self.last_write_seconds = monotonic() - start
+            self.write_seconds += self.last_write_seconds
+            self._queue.task_done()
+
+    def flush(self):
+        """
+        Waits until everything queued so far is on disk
+        """
+        self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+        atexit.unregister(self.close)
@@ -0,0 +1,30 @@
+"""
+Round trip checks for the tile encoder and decoder.
+
+Run from the repo root: python -m pytest tests
+"""
+import numpy as np
+from gbprinter import image as gbimage
+
+def test_twobit_round_trip():
+    """
+    Random images of random heights must survive encode -> decode unchanged
+    """
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        pages = int(rng.integers(0,12))
+        arr = rng.integers(0,4,size=(16*pages,160),dtype=np.uint8)
+        back = gbimage.gbtile_to_twobit(gbimage.twobit_to_gbtile(arr))
+        assert back.dtype == np.uint8
+        assert np.array_equal(arr,back), 'twobit round trip failed at {} pages'.format(pages)
+
+def test_gbtile_round_trip():
+    """
+    Random bytes must survive decode -> encode unchanged
+    """
+    rng = np.random.default_rng(1)
+    for _ in range(200):
+        pages = int(rng.integers(0,12))
+        raw = rng.integers(0,256,size=640*pages,dtype=np.uint8).tobytes()
+        assert gbimage.twobit_to_gbtile(gbimage.gbtile_to_twobit(raw)) == raw, \
+            'gbtile round trip failed at {} pages'.format(pages)